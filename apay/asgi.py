@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'apay.settings')
 
 application = get_asgi_application()
+
+# PDF views await the render pool rather than rendering on the event loop;
+# create it with the server instead of on the first download.
+from invoices.pdf import pdf_renderer  # noqa: E402
+
+pdf_renderer.start()
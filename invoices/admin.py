@@ -1,6 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.html import format_html
-from .models import UserProfile, Participant, Invoice, InvoiceItem
+from .models import UserProfile, Participant, Invoice, InvoiceItem, InvoiceStatusChange, OutboundEmail, recount_participants
+from .pagination import CachedCountPaginator
+from .previews import preview_url, with_proof_preview
+from .transitions import transition_invoices
 from datetime import date
 
 class InvoiceItemInline(admin.TabularInline):
@@ -31,8 +34,11 @@ class InvoiceAdmin(admin.ModelAdmin):
     list_editable = ['status']  # Now status is in both list_display and list_editable
     list_filter = ['status', 'issue_date', 'due_date', 'payment_date']
     search_fields = ['invoice_number', 'user__username', 'user__email', 'payment_reference']
-    readonly_fields = ['invoice_number', 'subtotal', 'tax_amount', 'total_amount', 'created_at', 'updated_at', 'proof_of_payment_display']
+    readonly_fields = ['invoice_number', 'issue_date', 'subtotal', 'tax_amount', 'total_amount', 'created_at', 'updated_at', 'proof_of_payment_display']
     inlines = [InvoiceItemInline, ParticipantInline]
+    paginator = CachedCountPaginator
+    # Skip the extra unfiltered COUNT(*) behind "N results (M total)" on filtered pages
+    show_full_result_count = False
     
     # Updated fieldsets to include proof of payment viewing
     fieldsets = [
@@ -53,9 +59,19 @@ class InvoiceAdmin(admin.ModelAdmin):
     
     actions = ['mark_as_paid', 'mark_as_under_review', 'mark_as_pending', 'mark_as_overdue']
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # The participant inline edits the membership table directly, bypassing m2m_changed
+        recount_participants([form.instance.pk])
+
+    def get_queryset(self, request):
+        # participants_count reads the stored participant_count, so rows need no COUNT
+        return with_proof_preview(super().get_queryset(request).select_related('user'))
+
     def participants_count(self, obj):
-        return obj.participants.count()
+        return obj.participant_count
     participants_count.short_description = 'Participants'
+    participants_count.admin_order_field = 'participant_count'
 
     def status_badge(self, obj):
         colors = {
@@ -74,6 +90,13 @@ class InvoiceAdmin(admin.ModelAdmin):
 
     def proof_of_payment_link(self, obj):
         if obj.proof_of_payment:
+            thumbnail = preview_url(obj)
+            if thumbnail:
+                return format_html(
+                    '<a href="{}" target="_blank"><img src="{}" style="max-width: 60px; max-height: 40px; border: 1px solid #ddd; border-radius: 3px;"></a>',
+                    obj.proof_of_payment.url,
+                    thumbnail
+                )
             return format_html(
                 '<a href="{}" target="_blank" style="background: #28a745; color: white; padding: 4px 8px; border-radius: 3px; text-decoration: none; font-size: 11px;">'
                 '<i class="fas fa-eye"></i> View Proof'
@@ -85,8 +108,9 @@ class InvoiceAdmin(admin.ModelAdmin):
 
     def proof_of_payment_display(self, obj):
         if obj.proof_of_payment:
-            file_extension = obj.proof_of_payment.name.split('.')[-1].lower()
-            if file_extension in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+            # Show the small rendered preview; the original only loads when opened
+            thumbnail = preview_url(obj)
+            if thumbnail:
                 return format_html(
                     '<div style="text-align: center;">'
                     '<a href="{}" target="_blank" style="background: #28a745; color: white; padding: 10px 20px; border-radius: 5px; text-decoration: none; display: inline-block; margin-bottom: 15px;">'
@@ -95,7 +119,7 @@ class InvoiceAdmin(admin.ModelAdmin):
                     '<img src="{}" style="max-width: 300px; max-height: 300px; border: 2px solid #ddd; border-radius: 5px;">'
                     '</div>',
                     obj.proof_of_payment.url,
-                    obj.proof_of_payment.url
+                    thumbnail
                 )
             else:
                 return format_html(
@@ -123,6 +147,11 @@ class InvoiceAdmin(admin.ModelAdmin):
             return "Paid"
         elif obj.status == 'under_review':
             return "Under Review"
+        elif obj.status == 'overdue':
+            # Set by the sweep_overdue_invoices command
+            return "Overdue"
+        elif obj.status == 'cancelled':
+            return "Cancelled"
         else:
             days_until_due = (obj.due_date - date.today()).days
             if days_until_due < 0:
@@ -133,24 +162,34 @@ class InvoiceAdmin(admin.ModelAdmin):
                 return f"Due in {days_until_due} days"
     payment_status.short_description = 'Payment Status'
 
+    def update_invoices(self, queryset, status, changed_by=None, **fields):
+        """Apply a bulk status transition; returns (moved, skipped)"""
+        return transition_invoices(queryset, status, changed_by=changed_by, **fields)
+
+    def report_transition(self, request, result, label):
+        moved, skipped = result
+        self.message_user(request, f'{moved} invoice(s) marked as {label}.')
+        if skipped:
+            self.message_user(request, f'{skipped} invoice(s) skipped: already {label} or cannot move to it.', messages.WARNING)
+
     def mark_as_paid(self, request, queryset):
-        updated = queryset.update(status='paid', payment_date=date.today())
-        self.message_user(request, f'{updated} invoice(s) marked as paid.')
+        result = self.update_invoices(queryset, 'paid', changed_by=request.user, payment_date=date.today())
+        self.report_transition(request, result, 'paid')
     mark_as_paid.short_description = "Mark selected invoices as paid"
 
     def mark_as_under_review(self, request, queryset):
-        updated = queryset.update(status='under_review')
-        self.message_user(request, f'{updated} invoice(s) marked as under review.')
+        result = self.update_invoices(queryset, 'under_review', changed_by=request.user)
+        self.report_transition(request, result, 'under review')
     mark_as_under_review.short_description = "Mark selected invoices as under review"
 
     def mark_as_pending(self, request, queryset):
-        updated = queryset.update(status='pending', payment_date=None)
-        self.message_user(request, f'{updated} invoice(s) marked as pending.')
+        result = self.update_invoices(queryset, 'pending', changed_by=request.user, payment_date=None)
+        self.report_transition(request, result, 'pending')
     mark_as_pending.short_description = "Mark selected invoices as pending"
 
     def mark_as_overdue(self, request, queryset):
-        updated = queryset.update(status='overdue')
-        self.message_user(request, f'{updated} invoice(s) marked as overdue.')
+        result = self.update_invoices(queryset, 'overdue', changed_by=request.user)
+        self.report_transition(request, result, 'overdue')
     mark_as_overdue.short_description = "Mark selected invoices as overdue"
 
 @admin.register(UserProfile)
@@ -161,13 +200,29 @@ class UserProfileAdmin(admin.ModelAdmin):
 @admin.register(Participant)
 class ParticipantAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'phone', 'user', 'created_at']
+    list_select_related = ['user']
     list_filter = ['created_at', 'user']
     search_fields = ['name', 'email', 'phone', 'user__username']
 
 @admin.register(InvoiceItem)
 class InvoiceItemAdmin(admin.ModelAdmin):
     list_display = ['invoice', 'description', 'quantity', 'unit_price', 'total']
+    # Invoice.__str__ shows the owner's username
+    list_select_related = ['invoice__user']
     list_filter = ['invoice__invoice_number']
     search_fields = ['description', 'invoice__invoice_number']
 
-
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['to', 'subject']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+
+@admin.register(InvoiceStatusChange)
+class InvoiceStatusChangeAdmin(admin.ModelAdmin):
+    list_display = ['invoice', 'from_status', 'to_status', 'changed_by', 'changed_at']
+    list_filter = ['to_status', 'changed_at']
+    search_fields = ['invoice__invoice_number']
+    list_select_related = ['invoice__user', 'changed_by']
+    readonly_fields = ['invoice', 'from_status', 'to_status', 'changed_by', 'changed_at']
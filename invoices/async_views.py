@@ -0,0 +1,113 @@
+"""
+Native async versions of the read-heavy pages, routed instead of the sync
+views when ASYNC_VIEWS is on (ASGI deployments). They load their data with
+the async ORM, issuing independent queries together, and skip the queries
+entirely when every cached fragment of the page is current. Templates are
+still rendered off the event loop, and form submissions are handed to the
+sync views.
+"""
+import asyncio
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import aget_object_or_404, render
+from . import views
+from .dashboard import USER_DASHBOARD_FRAGMENTS, USER_DASHBOARD_KEYS, abuild_user_dashboard, alist, build_user_dashboard
+from .forms import ProofOfPaymentForm
+from .fragments import afragment_context, afragments_cached, deferred
+from .models import DashboardStats, Invoice, Participant
+
+INVOICES_LIST_FRAGMENTS = ['invoices_summary', 'invoices_table']
+INVOICE_FRAGMENTS = ['invoice_summary', 'invoice_details']
+
+arender = sync_to_async(render)
+
+
+@login_required
+async def dashboard(request):
+    user = await request.auser()
+    if user.is_staff:
+        stats = await DashboardStats.objects.filter(pk=1).afirst() or await sync_to_async(DashboardStats.recompute)()
+        context = {
+            'total_users': stats.total_users,
+            'total_invoices': stats.total_invoices,
+            'pending_invoices': stats.pending_invoices,
+            'total_revenue': stats.total_revenue,
+        }
+        context.update(await afragment_context(user.pk))
+    else:
+        fragments = await afragment_context(user.pk)
+        if await afragments_cached(USER_DASHBOARD_FRAGMENTS, user.pk, fragments['data_version']):
+            # Only queried if a fragment expires before the template reads it
+            context = deferred(lambda: build_user_dashboard(user), USER_DASHBOARD_KEYS)
+        else:
+            context = await abuild_user_dashboard(user)
+        context.update(fragments)
+    return await arender(request, 'invoices/dashboard.html', context)
+
+
+@login_required
+async def invoices_list(request):
+    if request.method == 'POST':
+        return await sync_to_async(views.invoices_list)(request)
+
+    user = await request.auser()
+    invoices = Invoice.objects.filter(user=user).order_by('-issue_date')
+    fragments = await afragment_context(user.pk)
+    context = {'invoices': invoices}
+    if await afragments_cached(INVOICES_LIST_FRAGMENTS, user.pk, fragments['data_version']):
+        # Only queried if a fragment expires before the template reads it
+        context.update(deferred(lambda: invoices.aggregate(**views.invoice_totals()), views.INVOICE_TOTALS_KEYS))
+    else:
+        totals, context['invoices'] = await asyncio.gather(
+            invoices.aaggregate(**views.invoice_totals()),
+            alist(invoices),
+        )
+        context.update(totals)
+    context.update({
+        'proof_form': ProofOfPaymentForm(),
+        'proof_invoice': None,
+        **fragments,
+    })
+    return await arender(request, 'invoices/invoices_list.html', context)
+
+
+@login_required
+async def invoice_detail(request, invoice_id):
+    if request.method == 'POST':
+        return await sync_to_async(views.invoice_detail)(request, invoice_id)
+
+    # Allow staff users to view any invoice, regular users only their own
+    user = await request.auser()
+    invoices = Invoice.objects.select_related('user__userprofile')
+    if user.is_staff:
+        invoice = await aget_object_or_404(invoices, id=invoice_id)
+    else:
+        invoice = await aget_object_or_404(invoices, id=invoice_id, user=user)
+
+    fragments = await afragment_context(invoice.user_id)
+    context = {
+        'invoice': invoice,
+        'items': invoice.items.all(),
+        'participants': invoice.participants.all(),
+        'can_add_participants': invoice.can_add_participants(),
+        'proof_form': ProofOfPaymentForm(instance=invoice),
+        **fragments,
+    }
+    if not await afragments_cached(INVOICE_FRAGMENTS, invoice.pk, fragments['data_version']):
+        context['items'], context['participants'] = await asyncio.gather(
+            alist(context['items']),
+            alist(context['participants']),
+        )
+    return await arender(request, 'invoices/invoice.html', context)
+
+
+@login_required
+async def participants_list(request):
+    user = await request.auser()
+    participants = Participant.objects.filter(user=user).order_by('-created_at')
+    rows, total_participants = await asyncio.gather(alist(participants), participants.acount())
+    context = {
+        'participants': rows,
+        'total_participants': total_participants,
+    }
+    return await arender(request, 'invoices/participants_list.html', context)
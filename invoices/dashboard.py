@@ -0,0 +1,83 @@
+import asyncio
+from django.db import models
+from .models import Invoice, Participant
+
+UNPAID_STATUSES = ['pending', 'overdue']
+RECENT_ROWS = 5
+USER_DASHBOARD_KEYS = [
+    'invoices', 'participants', 'invoice_count', 'total_participants', 'latest_invoice',
+    'latest_unpaid_invoice', 'current_amount_due', 'unpaid_invoices_count',
+]
+# The dashboard.html sections that read USER_DASHBOARD_KEYS
+USER_DASHBOARD_FRAGMENTS = ['dashboard_actions', 'dashboard_summary', 'dashboard_recent']
+
+
+def recent_invoices(user):
+    """
+    The recent invoices, each carrying the user's invoice totals as window
+    aggregates, so the counts and the amount due come back with the rows.
+    """
+    unpaid = models.Q(status__in=UNPAID_STATUSES)
+    return Invoice.objects.filter(user=user).order_by('status', '-issue_date').annotate(
+        invoice_count=models.Window(models.Count('id')),
+        unpaid_count=models.Window(models.Count('id', filter=unpaid)),
+        amount_due=models.Window(models.Sum('total_amount', filter=unpaid)),
+    )[:RECENT_ROWS]
+
+
+def recent_participants(user):
+    return Participant.objects.filter(user=user).order_by('-created_at').annotate(
+        participant_count=models.Window(models.Count('id')),
+    )[:RECENT_ROWS]
+
+
+def unpaid_invoices(user):
+    return Invoice.objects.filter(user=user, status__in=UNPAID_STATUSES).order_by('status', '-issue_date')
+
+
+def first_unpaid(invoices):
+    """The latest unpaid invoice among the fetched rows, and whether it must be queried instead"""
+    latest_unpaid_invoice = next((invoice for invoice in invoices if invoice.status in UNPAID_STATUSES), None)
+    # Only when more than RECENT_ROWS invoices sort ahead of the first unpaid one
+    missing = latest_unpaid_invoice is None and bool(invoices) and invoices[0].unpaid_count > 0
+    return latest_unpaid_invoice, missing
+
+
+def user_dashboard_context(invoices, participants, latest_unpaid_invoice):
+    latest_invoice = invoices[0] if invoices else None
+    return {
+        'invoices': invoices,
+        'participants': participants,
+        'invoice_count': latest_invoice.invoice_count if latest_invoice else 0,
+        'total_participants': participants[0].participant_count if participants else 0,
+        'latest_invoice': latest_invoice,
+        'latest_unpaid_invoice': latest_unpaid_invoice,
+        'current_amount_due': (latest_invoice.amount_due if latest_invoice else None) or 0,
+        'unpaid_invoices_count': latest_invoice.unpaid_count if latest_invoice else 0,
+    }
+
+
+def build_user_dashboard(user):
+    """Gather the non-staff dashboard context in two queries"""
+    invoices = list(recent_invoices(user))
+    participants = list(recent_participants(user))
+    latest_unpaid_invoice, missing = first_unpaid(invoices)
+    if missing:
+        latest_unpaid_invoice = unpaid_invoices(user).first()
+    return user_dashboard_context(invoices, participants, latest_unpaid_invoice)
+
+
+async def abuild_user_dashboard(user):
+    """build_user_dashboard() for async views, with the two queries issued together"""
+    invoices, participants = await asyncio.gather(
+        alist(recent_invoices(user)),
+        alist(recent_participants(user)),
+    )
+    latest_unpaid_invoice, missing = first_unpaid(invoices)
+    if missing:
+        latest_unpaid_invoice = await unpaid_invoices(user).afirst()
+    return user_dashboard_context(invoices, participants, latest_unpaid_invoice)
+
+
+async def alist(queryset):
+    return [row async for row in queryset]
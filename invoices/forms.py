@@ -5,6 +5,7 @@ from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 import re
 from .models import UserProfile, Participant, Invoice
+from .uploads import MAX_PROOF_SIZE, PROOF_EXTENSIONS
 import os
 
 
@@ -115,6 +116,24 @@ class MultipleParticipantForm(forms.Form):
         help_text='Format: Name,Email,Phone (one per line)'
     )
 
+class ParticipantFileImportForm(forms.Form):
+    participants_file = forms.FileField(
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+        help_text='CSV or Excel (.xlsx) file with Name, Email and Phone columns'
+    )
+
+    def clean_participants_file(self):
+        upload = self.cleaned_data.get('participants_file')
+        ext = os.path.splitext(upload.name)[1].lower()
+        if ext not in ['.csv', '.xlsx']:
+            raise forms.ValidationError('Unsupported file type. Please upload a CSV or Excel (.xlsx) file.')
+        if ext == '.xlsx':
+            try:
+                import openpyxl  # noqa: F401
+            except ImportError:
+                raise forms.ValidationError('Excel uploads are not available. Please save the file as CSV and upload it again.')
+        return upload
+
 class AdminPaymentForm(forms.ModelForm):
     class Meta:
         model = Invoice
@@ -139,15 +158,14 @@ class ProofOfPaymentForm(forms.ModelForm):
         proof = self.cleaned_data.get('proof_of_payment')
         if proof:
             # Validate file type
-            valid_extensions = ['.pdf', '.jpg', '.jpeg', '.png', '.gif']
             ext = os.path.splitext(proof.name)[1].lower()
-            if ext not in valid_extensions:
+            if ext not in PROOF_EXTENSIONS:
                 raise forms.ValidationError(
                     'Unsupported file type. Please upload PDF or image files (PDF, JPG, PNG, GIF).'
                 )
             
             # Validate file size (5MB limit)
-            if proof.size > 5 * 1024 * 1024:
+            if proof.size > MAX_PROOF_SIZE:
                 raise forms.ValidationError('File size must be less than 5MB.')
         
         return proof
@@ -166,15 +184,14 @@ class AdminPaymentVerificationForm(forms.ModelForm):
         proof = self.cleaned_data.get('proof_of_payment')
         if proof:
             # Validate file type
-            valid_extensions = ['.pdf', '.jpg', '.jpeg', '.png', '.gif']
             ext = os.path.splitext(proof.name)[1].lower()
-            if ext not in valid_extensions:
+            if ext not in PROOF_EXTENSIONS:
                 raise forms.ValidationError(
                     'Unsupported file type. Please upload PDF or image files (PDF, JPG, PNG, GIF).'
                 )
             
             # Validate file size (5MB limit)
-            if proof.size > 5 * 1024 * 1024:
+            if proof.size > MAX_PROOF_SIZE:
                 raise forms.ValidationError('File size must be less than 5MB.')
         
         return proof
\ No newline at end of file
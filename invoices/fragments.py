@@ -0,0 +1,79 @@
+"""
+Per-user versioned template fragment caching.
+
+Every user has a data version counter in the cache. Templates wrap their
+user-specific sections in ``{% cache fragment_timeout <name> ... data_version %}``
+so any write to the user's invoices, participants or profile, which bumps the
+counter, moves them to fresh cache keys. Old fragments are never read again
+and simply expire.
+
+The async views check with afragments_cached() whether the sections they
+render are all cached before deciding to run their queries.
+"""
+import time
+from functools import cache as memoize
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+
+
+def data_version_key(user_id):
+    return f'user-data-version:{user_id}'
+
+
+def data_version(user_id):
+    key = data_version_key(user_id)
+    # Seed from the clock so a counter lost to eviction never reuses an old value
+    cache.add(key, time.time_ns(), timeout=None)
+    return cache.get(key)
+
+
+def bump_data_version(*user_ids):
+    """Invalidate the users' cached fragments once the current transaction commits"""
+    def bump():
+        for user_id in set(user_ids):
+            try:
+                cache.incr(data_version_key(user_id))
+            except ValueError:
+                pass  # Not seeded yet; the next read starts from a newer value
+    transaction.on_commit(bump)
+
+
+async def adata_version(user_id):
+    key = data_version_key(user_id)
+    await cache.aadd(key, time.time_ns(), timeout=None)
+    return await cache.aget(key)
+
+
+def fragment_timeout():
+    return getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 60 * 60)
+
+
+def fragment_context(user_id):
+    return {'data_version': data_version(user_id), 'fragment_timeout': fragment_timeout()}
+
+
+async def afragment_context(user_id):
+    return {'data_version': await adata_version(user_id), 'fragment_timeout': fragment_timeout()}
+
+
+def fragment_store():
+    """The cache the {% cache %} tag keeps fragments in"""
+    return caches['template_fragments' if 'template_fragments' in settings.CACHES else 'default']
+
+
+async def afragments_cached(names, *vary_on):
+    """Whether each named fragment is cached for the given vary_on values"""
+    keys = [make_template_fragment_key(name, vary_on) for name in names]
+    return len(await fragment_store().aget_many(keys)) == len(keys)
+
+
+def deferred(build, keys):
+    """
+    Context entries for the given keys of the dict build() returns. Templates
+    call them on first use, so build() runs at most once, and not at all when
+    every section using them comes from the fragment cache.
+    """
+    build = memoize(build)
+    return {key: (lambda key=key: build()[key]) for key in keys}
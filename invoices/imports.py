@@ -0,0 +1,69 @@
+import codecs
+import csv
+import os
+from itertools import islice
+
+HEADER_NAMES = ['name', 'full name']
+
+
+class ImportFileError(Exception):
+    """Raised when an uploaded participants file cannot be parsed"""
+
+
+def clean_row(values):
+    return ['' if value is None else str(value).strip() for value in values]
+
+
+def iter_csv_rows(upload):
+    """Yield (line number, fields) from a CSV upload, reading it chunk by chunk"""
+    # UploadedFile iterates its chunks() as lines, so only one line is decoded at a time
+    reader = csv.reader(codecs.iterdecode(upload, 'utf-8-sig'))
+    try:
+        for values in reader:
+            yield reader.line_num, clean_row(values)
+    except (csv.Error, UnicodeDecodeError) as exc:
+        raise ImportFileError(f'Line {reader.line_num + 1} could not be read as UTF-8 CSV.') from exc
+
+
+def iter_xlsx_rows(upload):
+    """Yield (row number, fields) from the first sheet of an XLSX upload"""
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(upload, read_only=True, data_only=True)
+    except Exception as exc:
+        raise ImportFileError('The file is not a valid Excel (.xlsx) workbook.') from exc
+    row_number = 0
+    try:
+        # Read-only sheets are parsed as they are iterated, so a malformed
+        # sheet only fails here
+        for row_number, values in enumerate(workbook.worksheets[0].iter_rows(values_only=True), 1):
+            values = clean_row(values)
+            # Read-only sheets pad rows to the widest row, so drop empty trailing cells
+            while values and not values[-1]:
+                values.pop()
+            yield row_number, values
+    except Exception as exc:
+        raise ImportFileError(f'Row {row_number + 1} of the Excel (.xlsx) workbook could not be read.') from exc
+    finally:
+        workbook.close()
+
+
+def iter_participant_rows(upload):
+    """Yield non-blank participant rows from a CSV or XLSX upload, skipping a header row"""
+    if os.path.splitext(upload.name)[1].lower() == '.xlsx':
+        rows = iter_xlsx_rows(upload)
+    else:
+        rows = iter_csv_rows(upload)
+    for line_number, values in rows:
+        if not any(values):
+            continue
+        if line_number == 1 and values[0].lower() in HEADER_NAMES:
+            continue
+        yield line_number, values
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
@@ -0,0 +1,80 @@
+import statistics
+import time
+from concurrent import futures
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from invoices.models import Invoice
+
+PAGES = ['dashboard', 'invoices_list', 'invoice_detail', 'participants_list']
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the read-heavy pages on running servers and compare requests per second. '
+        'Start the same project twice against this database, e.g. '
+        '"uvicorn apay.asgi:application --port 8000" with ASYNC_VIEWS = False and '
+        '"--port 8001" with ASYNC_VIEWS = True, then pass both with --server.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', required=True, help='Base URL of a running server; repeat to compare')
+        parser.add_argument('--user', help='Username to browse as (default: the first non-staff user with an invoice)')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per page and server')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once')
+
+    def handle(self, *args, **options):
+        invoice = self.pick_invoice(options['user'])
+        cookie = self.session_cookie(invoice.user)
+        paths = {
+            page: reverse(page, args=[invoice.pk] if page == 'invoice_detail' else [])
+            for page in PAGES
+        }
+        for server in options['server']:
+            self.stdout.write(self.style.MIGRATE_HEADING(server))
+            for page, path in paths.items():
+                rps, p50, p95, errors = self.load(server.rstrip('/') + path, cookie, options['requests'], options['concurrency'])
+                self.stdout.write(
+                    f'  {page:<18} {rps:8.1f} req/s   p50 {p50:6.1f} ms   p95 {p95:6.1f} ms   errors {errors}'
+                )
+
+    def pick_invoice(self, username):
+        invoices = Invoice.objects.select_related('user').order_by('pk')
+        if username:
+            invoice = invoices.filter(user__username=username).first()
+        else:
+            invoice = invoices.filter(user__is_staff=False).first()
+        if invoice is None:
+            raise CommandError('No invoice to browse; create some data first.')
+        return invoice
+
+    def session_cookie(self, user):
+        """Log the user in through the session store the servers share with this command"""
+        client = Client()
+        client.force_login(user)
+        return f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+    def load(self, url, cookie, total, concurrency):
+        """Return (requests per second, p50 ms, p95 ms, errors) for total GETs of url"""
+        def fetch(_):
+            started = time.perf_counter()
+            try:
+                with urlopen(Request(url, headers={'Cookie': cookie}), timeout=30) as response:
+                    response.read()
+                    # A lapsed session ends on the login page instead
+                    ok = response.status == 200 and response.url == url
+            except (HTTPError, OSError):
+                ok = False
+            return (time.perf_counter() - started) * 1000, ok
+
+        started = time.perf_counter()
+        with futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, range(total)))
+        elapsed = time.perf_counter() - started
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, ok in results if not ok)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return total / elapsed, statistics.median(latencies), p95, errors
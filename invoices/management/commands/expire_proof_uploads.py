@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from invoices.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = 'Remove resumable proof uploads that stopped receiving chunks, with their stored chunks'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Removed {expire_uploads()} abandoned upload(s).')
@@ -0,0 +1,96 @@
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.backends.base.creation import TEST_DATABASE_PREFIX
+from invoices.models import UNPAID_STATUSES, Invoice, Participant, UserProfile
+
+# Indexes added for the query shapes below (migrations 0011 and 0017)
+QUERY_SHAPE_INDEXES = [
+    'invoice_user_status_date_idx',
+    'invoice_user_issue_date_idx',
+    'participant_user_created_idx',
+    'profile_verification_token_idx',
+]
+
+
+def hot_queries(user):
+    """(label, queryset) for the lookups the indexes were designed for"""
+    invoices = Invoice.objects.filter(user=user)
+    return [
+        ('dashboard invoices', invoices.order_by('status', '-issue_date')),
+        ('dashboard latest unpaid', invoices.filter(status__in=UNPAID_STATUSES).order_by('status', '-issue_date')[:1]),
+        ('add_participant unpaid invoice', invoices.filter(status__in=UNPAID_STATUSES).order_by('-issue_date', '-id')[:1]),
+        ('invoices_list', invoices.order_by('-issue_date')),
+        ('participants_list', Participant.objects.filter(user=user).order_by('-created_at')),
+        ('verify_email', UserProfile.objects.filter(verification_token='0' * 32)),
+    ]
+
+
+def scratch_database():
+    """Whether the database may have its indexes dropped for a run: under DEBUG or when it is a test database"""
+    name = str(connection.settings_dict['NAME'])
+    in_memory = connection.vendor == 'sqlite' and connection.is_in_memory_db()
+    return settings.DEBUG or in_memory or name.startswith(TEST_DATABASE_PREFIX)
+
+
+class Command(BaseCommand):
+    help = 'Print EXPLAIN plans and timings for the hot invoice queries with and without the query-shape indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to run the per-user queries for (default: the first user)')
+        parser.add_argument('--repeat', type=int, default=100, help='Executions per query when timing')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('No user to run the queries for.')
+        # DROP INDEX takes an exclusive lock on the table until the rollback
+        # (ACCESS EXCLUSIVE on PostgreSQL), blocking every invoice query for
+        # the whole run
+        if not scratch_database():
+            raise CommandError('Refusing to drop indexes on this database; run with DEBUG or against a test database.')
+
+        # Drop the indexes inside a transaction that is rolled back, so the
+        # "before" plans are taken against the same data without a migration.
+        # Reconnecting between runs discards statements prepared against the
+        # other schema (sqlite3 caches them per connection).
+        self.reconnect()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for name in QUERY_SHAPE_INDEXES:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+            before = self.measure(user, options['repeat'])
+            transaction.set_rollback(True)
+        self.reconnect()
+        after = self.measure(user, options['repeat'])
+
+        for label, (plan_before, ms_before) in before.items():
+            plan_after, ms_after = after[label]
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(f'  before ({ms_before:.3f} ms):')
+            self.stdout.write(self.indent(plan_before))
+            self.stdout.write(f'  after ({ms_after:.3f} ms):')
+            self.stdout.write(self.indent(plan_after))
+
+    def reconnect(self):
+        if not connection.in_atomic_block:
+            connection.close()
+
+    def measure(self, user, repeat):
+        """Return {label: (plan, mean milliseconds)} for every hot query"""
+        results = {}
+        for label, queryset in hot_queries(user):
+            plan = queryset.explain()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            results[label] = plan, (time.perf_counter() - start) * 1000 / repeat
+        return results
+
+    def indent(self, plan):
+        return '\n'.join(f'    {line}' for line in plan.splitlines())
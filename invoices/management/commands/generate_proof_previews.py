@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from invoices.previews import generate_missing_previews
+
+
+class Command(BaseCommand):
+    help = 'Render thumbnails of uploaded proofs of payment for the admin pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Proofs rendered per batch')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds to wait when nothing is missing')
+        parser.add_argument('--once', action='store_true', help='Render every missing preview, then exit')
+
+    def handle(self, *args, **options):
+        while True:
+            handled = generate_missing_previews(options['batch_size'])
+            if handled:
+                self.stdout.write(f'Rendered previews for {handled} proof(s).')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
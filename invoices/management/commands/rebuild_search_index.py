@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from invoices.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search tables used by the admin invoice and participant lists'
+
+    def handle(self, *args, **options):
+        totals = rebuild_search_index()
+        if totals is None:
+            self.stdout.write('No search tables on this database; trigram indexes (PostgreSQL) need no rebuild.')
+            return
+        self.stdout.write(f'Indexed {totals[0]} invoice(s) and {totals[1]} participant(s).')
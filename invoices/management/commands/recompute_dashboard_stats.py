@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from invoices.models import DashboardStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the staff dashboard stats from the source tables (run periodically as a safety net)'
+
+    def handle(self, *args, **options):
+        stats = DashboardStats.recompute()
+        self.stdout.write(
+            f'{stats.total_users} user(s), {stats.total_invoices} invoice(s), '
+            f'{stats.pending_invoices} pending, {stats.total_revenue} revenue.'
+        )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from invoices.models import recount_participants
+
+
+class Command(BaseCommand):
+    help = 'Rewrite Invoice.participant_count from the invoice participant table where it has drifted'
+
+    def handle(self, *args, **options):
+        fixed = recount_participants()
+        self.stdout.write(f'Reconciled participant counts on {fixed} invoice(s).')
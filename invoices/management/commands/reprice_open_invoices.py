@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from invoices.pricing import reprice_open_invoices
+
+
+class Command(BaseCommand):
+    help = 'Recompute the amounts, notes and items of every pending or overdue invoice with the current pricing, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Invoices repriced per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='List the changes without writing them')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = changed = 0
+        for count, changes in reprice_open_invoices(options['batch_size'], dry_run=options['dry_run']):
+            total += count
+            changed += len(changes)
+            if options['dry_run'] or options['verbosity'] > 1:
+                for invoice, (old_count, old_total, old_notes), (new_count, new_total, new_notes) in changes:
+                    line = f'{invoice.invoice_number}: {old_count} -> {new_count} participant(s), KES {old_total:,.2f} -> {new_total:,.2f}'
+                    if old_notes != new_notes:
+                        line += f'\n  notes: {old_notes!r} -> {new_notes!r}'
+                    self.stdout.write(line)
+        elapsed = time.monotonic() - started
+        verb = 'Would change' if options['dry_run'] else 'Changed'
+        self.stdout.write(
+            f'{verb} {changed} of {total} open invoice(s) in {elapsed:.2f}s ({total / max(elapsed, 1e-6):.0f}/s).'
+        )
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from invoices.outbox import deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Emails claimed and sent per connection')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Send everything currently due, then exit')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = deliver_pending(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} email(s), {failed} failed.')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from invoices.transitions import sweep_overdue
+
+
+class Command(BaseCommand):
+    help = 'Move pending invoices past their due date to overdue, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Invoices moved per transaction')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = 0
+        for moved in sweep_overdue(options['batch_size']):
+            total += moved
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Moved a batch of {moved} invoice(s).')
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Moved {total} invoice(s) to overdue in {elapsed:.2f}s ({total / max(elapsed, 1e-6):.0f}/s).'
+        )
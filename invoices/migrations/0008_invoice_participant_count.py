@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:47
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_participant_count(apps, schema_editor):
+    Invoice = apps.get_model('invoices', 'Invoice')
+    Membership = Invoice.participants.through
+    counts = Membership.objects.filter(invoice_id=models.OuterRef('pk')).order_by().values('invoice_id').annotate(
+        total=models.Count('id')
+    ).values('total')
+    Invoice.objects.update(participant_count=Coalesce(models.Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0007_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_participant_count, migrations.RunPython.noop),
+    ]
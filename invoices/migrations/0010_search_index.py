@@ -0,0 +1,66 @@
+from django.db import migrations
+
+SQLITE_TABLES = ['invoices_invoice_search', 'invoices_participant_search']
+
+TRIGRAM_INDEXES = [
+    ('invoice_number_trgm_idx', 'invoices_invoice', 'invoice_number'),
+    ('invoice_payment_ref_trgm_idx', 'invoices_invoice', 'payment_reference'),
+    ('participant_name_trgm_idx', 'invoices_participant', 'name'),
+    ('participant_email_trgm_idx', 'invoices_participant', 'email'),
+    ('participant_phone_trgm_idx', 'invoices_participant', 'phone'),
+    ('auth_user_username_trgm_idx', 'auth_user', 'username'),
+    ('auth_user_email_trgm_idx', 'auth_user', 'email'),
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_version()")
+            version = tuple(int(part) for part in cursor.fetchone()[0].split('.'))
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            has_fts5 = cursor.fetchone()[0]
+        if version < (3, 34) or not has_fts5:
+            # The trigram tokenizer is unavailable; search falls back to icontains
+            return
+        for table in SQLITE_TABLES:
+            schema_editor.execute(f"CREATE VIRTUAL TABLE {table} USING fts5(body, tokenize='trigram')")
+        schema_editor.execute(
+            "INSERT INTO invoices_invoice_search(rowid, body) "
+            "SELECT i.id, i.invoice_number || char(10) || i.payment_reference || char(10) || u.username || char(10) || u.email "
+            "FROM invoices_invoice i JOIN auth_user u ON u.id = i.user_id"
+        )
+        schema_editor.execute(
+            "INSERT INTO invoices_participant_search(rowid, body) "
+            "SELECT p.id, p.name || char(10) || p.email || char(10) || p.phone || char(10) || u.username "
+            "FROM invoices_participant p JOIN auth_user u ON u.id = p.user_id"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, table, column in TRIGRAM_INDEXES:
+            # Django compiles icontains to UPPER(column::text) LIKE UPPER(...), so index that expression
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)"
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for table in SQLITE_TABLES:
+            schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+    elif vendor == 'postgresql':
+        for name, table, column in TRIGRAM_INDEXES:
+            schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0009_invoice_issue_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0016_invoice_pending_due_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # 0011 left four indexes on invoices_invoice leading with user:
+    # invoice_user_status_date_idx, invoice_user_issue_date_idx, the partial
+    # invoice_unpaid_idx on the same (user, -issue_date) columns, and the
+    # foreign key's own. invoice_user_issue_date_idx is kept for invoices_list,
+    # the one query that orders a user's invoices by date without a status.
+    # The unpaid lookups filter on status, which invoice_user_status_date_idx
+    # already seeks on, and the staff pending count now reads DashboardStats,
+    # so the partial index and the foreign key index only cost writes.
+    operations = [
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='invoice_unpaid_idx',
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
 import uuid
+from decimal import Decimal
 from datetime import date, timedelta
 from django.utils import timezone
 
@@ -16,6 +18,12 @@ class UserProfile(models.Model):
     verification_sent_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # verify_email looks profiles up by token
+            models.Index(fields=['verification_token'], name='profile_verification_token_idx'),
+        ]
+
     def __str__(self):
         return self.user.username
 
@@ -34,6 +42,12 @@ class Participant(models.Model):
     phone = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # participants_list: filter(user=...).order_by('-created_at')
+            models.Index(fields=['user', '-created_at'], name='participant_user_created_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -47,8 +61,10 @@ class Invoice(models.Model):
     ]
 
     invoice_number = models.CharField(max_length=50, unique=True)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # invoice_user_issue_date_idx leads with user, so the foreign key needs no index of its own
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     participants = models.ManyToManyField(Participant, blank=True)
+    participant_count = models.PositiveIntegerField(default=0, editable=False)
     issue_date = models.DateField(auto_now_add=True)
     due_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -83,17 +99,30 @@ class Invoice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination in admin_invoice_list seeks on (issue_date, id)
+            models.Index(fields=['issue_date', 'id'], name='invoice_issue_date_id_idx'),
+            # dashboard: filter(user=...).order_by('status', '-issue_date')
+            models.Index(fields=['user', 'status', '-issue_date'], name='invoice_user_status_date_idx'),
+            # invoices_list: filter(user=...).order_by('-issue_date'); also serves
+            # every other lookup by user. The unpaid invoice add_participant
+            # appends to is found through invoice_user_status_date_idx.
+            models.Index(fields=['user', '-issue_date'], name='invoice_user_issue_date_idx'),
+            # The overdue sweeper walks pending invoices in due date order
+            models.Index(
+                fields=['due_date', 'id'],
+                name='invoice_pending_due_idx',
+                condition=models.Q(status='pending'),
+            ),
+        ]
+
     def __str__(self):
         return f"Invoice {self.invoice_number} - {self.user.username}"
 
     def calculate_pricing(self):
-        participant_count = self.participants.count()
-        if participant_count <= 3:
-            return 15000 * participant_count
-        elif participant_count == 4:
-            return 45000
-        else:  # More than 4
-            return 11000 * participant_count
+        from .pricing import quote_invoice
+        return quote_invoice(self).subtotal
 
     def mark_as_paid(self, payment_reference='', payment_date=None):
         self.status = 'paid'
@@ -110,17 +139,21 @@ class Invoice(models.Model):
 
     def can_add_participants(self):
         """Check if this invoice can accept new participants"""
-        return self.status == 'pending'
+        return self.status in UNPAID_STATUSES
     
     def is_editable(self):
         """Check if this invoice can be modified"""
         return self.status in ['pending', 'overdue']
     
     def save(self, *args, **kwargs):
-        # When proof of payment is uploaded, change status to 'under_review'
-        if self.proof_of_payment and self.status == 'pending':
+        # When proof of payment is uploaded to an unpaid invoice, including one
+        # the sweeper has made overdue, change status to 'under_review'
+        if self.proof_of_payment and self.status in UNPAID_STATUSES:
             self.status = 'under_review'
-        super().save(*args, **kwargs)
+        # refresh_participant_count locks the stored row, so concurrent saves
+        # take their dashboard stats delta one after the other
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 class InvoiceItem(models.Model):
     invoice = models.ForeignKey(Invoice, related_name='items', on_delete=models.CASCADE)
@@ -133,6 +166,104 @@ class InvoiceItem(models.Model):
         self.total = self.quantity * self.unit_price
         super().save(*args, **kwargs)
 
+class InvoiceStatusChange(models.Model):
+    """Audit record of a status transition applied to an invoice"""
+    invoice = models.ForeignKey(Invoice, related_name='status_changes', on_delete=models.CASCADE)
+    from_status = models.CharField(max_length=20, choices=Invoice.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=Invoice.STATUS_CHOICES)
+    changed_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['invoice', '-changed_at'], name='status_change_invoice_idx')]
+
+    def __str__(self):
+        return f"{self.invoice_id}: {self.from_status} -> {self.to_status}"
+
+class ProofUpload(models.Model):
+    """A resumable proof of payment upload whose chunks are stored as they arrive"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    invoice = models.ForeignKey(Invoice, related_name='proof_uploads', on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    received = models.PositiveIntegerField(default=0)
+    chunk_count = models.PositiveIntegerField(default=0)
+    payment_method = models.CharField(max_length=50, blank=True)
+    payment_notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size}) for {self.invoice_id}"
+
+    def is_complete(self):
+        return self.received == self.size
+
+class ProofPreview(models.Model):
+    """The rendered preview of a stored proof of payment; blank when it could not be rendered"""
+    source = models.CharField(max_length=100, unique=True)
+    preview = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.source
+
+class OutboundEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx')]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to}"
+
+class DashboardStats(models.Model):
+    """Single-row store of the staff dashboard numbers, kept current by signals"""
+    total_users = models.IntegerField(default=0)
+    total_invoices = models.IntegerField(default=0)
+    pending_invoices = models.IntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    recomputed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Dashboard stats'
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).first() or cls.recompute()
+
+    @classmethod
+    def recompute(cls):
+        """Rebuild the row from the source tables"""
+        stats, _ = cls.objects.update_or_create(pk=1, defaults={
+            'total_users': User.objects.count(),
+            **invoice_stats(Invoice.objects.all()),
+            'recomputed_at': timezone.now(),
+        })
+        return stats
+
+    @classmethod
+    def apply(cls, deltas):
+        """Add deltas to the stored numbers in one UPDATE"""
+        changes = {field: models.F(field) + delta for field, delta in deltas.items() if delta}
+        if changes:
+            cls.objects.filter(pk=1).update(**changes)
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -140,4 +271,194 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.userprofile.save()
\ No newline at end of file
+    instance.userprofile.save()
+
+UNPAID_STATUSES = ['pending', 'overdue']
+NO_STATS = {'total_invoices': 0, 'pending_invoices': 0, 'total_revenue': Decimal(0)}
+
+def invoice_contribution(status, total_amount):
+    """What a single invoice adds to the dashboard stats"""
+    return {
+        'total_invoices': 1,
+        'pending_invoices': 1 if status in UNPAID_STATUSES else 0,
+        'total_revenue': Decimal(total_amount or 0) if status == 'paid' else Decimal(0),
+    }
+
+def invoice_stats(invoices):
+    """What a queryset of invoices adds to the dashboard stats, in one query"""
+    totals = invoices.aggregate(
+        total_invoices=models.Count('id'),
+        pending_invoices=models.Count('id', filter=models.Q(status__in=UNPAID_STATUSES)),
+        total_revenue=models.Sum('total_amount', filter=models.Q(status='paid')),
+    )
+    totals['total_revenue'] = totals['total_revenue'] or Decimal(0)
+    return totals
+
+def subtract_stats(after, before):
+    return {field: after[field] - before[field] for field in after}
+
+def actual_participant_count():
+    """An Invoice annotation counting the membership rows, without a GROUP BY on the invoices"""
+    Membership = Invoice.participants.through
+    return Coalesce(
+        models.Subquery(
+            Membership.objects.filter(invoice_id=models.OuterRef('pk'))
+            .order_by().values('invoice_id').annotate(total=models.Count('id')).values('total')
+        ),
+        0,
+    )
+
+def recount_participants(invoice_ids=None):
+    """Rewrite the stored participant_count from the membership table; return rows changed"""
+    actual = actual_participant_count()
+    invoices = Invoice.objects.all() if invoice_ids is None else Invoice.objects.filter(pk__in=invoice_ids)
+    return invoices.annotate(actual=actual).exclude(participant_count=models.F('actual')).update(participant_count=actual)
+
+@receiver(m2m_changed, sender=Invoice.participants.through)
+def track_participant_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        if reverse:
+            Invoice.objects.filter(pk__in=pk_set).update(participant_count=models.F('participant_count') + 1)
+        else:
+            Invoice.objects.filter(pk=instance.pk).update(participant_count=models.F('participant_count') + len(pk_set))
+    elif action == 'pre_clear' and reverse:
+        instance._cleared_invoice_ids = list(instance.invoice_set.values_list('pk', flat=True))
+    elif action == 'post_remove':
+        recount_participants(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        recount_participants(instance._cleared_invoice_ids if reverse else [instance.pk])
+
+# Deleting a participant cascades to the membership table without m2m_changed
+@receiver(pre_delete, sender=Participant)
+def remember_participant_invoices(sender, instance, **kwargs):
+    instance._invoice_ids = list(instance.invoice_set.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Participant)
+def recount_after_participant_delete(sender, instance, **kwargs):
+    recount_participants(instance._invoice_ids)
+
+# Sent once per bulk transition with the (id, user_id, status, total_amount)
+# rows as they were before, and the status they moved to
+invoices_transitioned = Signal()
+
+@receiver(invoices_transitioned)
+def apply_invoice_transitions(sender, rows, status, **kwargs):
+    from .fragments import bump_data_version
+    from .pdf import invalidate_invoice_pdf
+    deltas = dict.fromkeys(NO_STATS, 0)
+    for _, _, from_status, total_amount in rows:
+        change = subtract_stats(invoice_contribution(status, total_amount), invoice_contribution(from_status, total_amount))
+        for field, delta in change.items():
+            deltas[field] += delta
+    DashboardStats.apply(deltas)
+    invalidate_invoice_pdf(*(invoice_id for invoice_id, _, _, _ in rows))
+    bump_data_version(*(user_id for _, user_id, _, _ in rows))
+
+# Sent by pricing.reconcile_items with the invoices whose items it wrote
+invoice_items_changed = Signal()
+
+@receiver(invoice_items_changed)
+def invalidate_invoice_item_caches(sender, invoices, **kwargs):
+    from .fragments import bump_data_version
+    from .pdf import invalidate_invoice_pdf
+    invalidate_invoice_pdf(*(invoice.pk for invoice in invoices))
+    bump_data_version(*{invoice.user_id for invoice in invoices})
+
+@receiver(post_save, sender=Invoice)
+def invalidate_invoice_pdf_cache(sender, instance, **kwargs):
+    from .pdf import invalidate_invoice_pdf
+    invalidate_invoice_pdf(instance.pk)
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_save, sender=Participant)
+def update_search_index(sender, instance, **kwargs):
+    from .search import index_invoices, index_participants
+    if sender is Invoice:
+        index_invoices([instance])
+    else:
+        index_participants([instance])
+
+
+@receiver(post_delete, sender=Invoice)
+@receiver(post_delete, sender=Participant)
+def remove_from_search_index(sender, instance, **kwargs):
+    from .search import unindex
+    unindex(sender, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def reindex_user_documents(sender, instance, created, update_fields=None, **kwargs):
+    # New users have nothing indexed yet, and login only touches last_login
+    if created or (update_fields is not None and not {'username', 'email'} & set(update_fields)):
+        return
+    from .search import index_user
+    index_user(instance)
+
+
+@receiver(pre_save, sender=Invoice)
+def refresh_participant_count(sender, instance, raw=False, update_fields=None, **kwargs):
+    # The membership receivers keep participant_count with UPDATEs, so an
+    # instance loaded earlier holds a stale count. A full save writes the
+    # stored one back, read under the row lock Invoice.save() holds until it
+    # commits; saves naming their update_fields write what they name.
+    if raw or instance._state.adding or update_fields is not None:
+        return
+    stored = Invoice.objects.select_for_update().filter(pk=instance.pk).values_list('participant_count', flat=True).first()
+    if stored is not None:
+        instance.participant_count = stored
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_invoice_stats(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'status', 'total_amount'} & set(update_fields):
+        instance._stats_before = None
+        return
+    stored = None
+    if not instance._state.adding:
+        # Locked until Invoice.save() commits, so two saves cannot both apply a delta from the same row
+        stored = Invoice.objects.select_for_update().filter(pk=instance.pk).values('status', 'total_amount').first()
+    instance._stats_before = invoice_contribution(**stored) if stored else NO_STATS
+
+
+@receiver(post_save, sender=Invoice)
+def update_dashboard_stats_on_save(sender, instance, **kwargs):
+    if instance._stats_before is not None:
+        after = invoice_contribution(instance.status, instance.total_amount)
+        DashboardStats.apply(subtract_stats(after, instance._stats_before))
+
+
+@receiver(post_delete, sender=Invoice)
+def update_dashboard_stats_on_delete(sender, instance, **kwargs):
+    DashboardStats.apply({
+        field: -value for field, value in invoice_contribution(instance.status, instance.total_amount).items()
+    })
+
+
+@receiver(post_save, sender=User)
+def count_new_user(sender, instance, created, **kwargs):
+    if created:
+        DashboardStats.apply({'total_users': 1})
+
+
+@receiver(post_delete, sender=User)
+def count_deleted_user(sender, instance, **kwargs):
+    DashboardStats.apply({'total_users': -1})
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+@receiver(post_save, sender=UserProfile)
+def bump_user_data_version(sender, instance, **kwargs):
+    from .fragments import bump_data_version
+    bump_data_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Invoice.participants.through)
+def bump_data_version_on_membership_change(sender, instance, action, **kwargs):
+    # Invoices and participants on either side belong to the same user
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        from .fragments import bump_data_version
+        bump_data_version(instance.user_id)
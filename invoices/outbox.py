@@ -0,0 +1,79 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboundEmail
+
+
+def queue_email(subject, body, to, html_body=''):
+    """Store an email in the outbox for the send_outbox worker to deliver"""
+    return OutboundEmail.objects.create(to=to, subject=subject, body=body, html_body=html_body)
+
+
+def retry_delay(attempts):
+    """Exponential backoff between delivery attempts, capped at one hour"""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 60 * 60))
+
+
+def record_failure(email, error, now):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5):
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = now + retry_delay(email.attempts)
+
+
+def deliver_pending(batch_size=50):
+    """
+    Claim one batch of due emails and send them over a single connection.
+    Rows are locked with SKIP LOCKED so several workers can run side by side.
+    Returns a (sent, failed) tuple; both are 0 when nothing was due.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not batch:
+            return 0, 0
+
+        sent = failed = 0
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as exc:
+            for email in batch:
+                record_failure(email, exc, now)
+            failed = len(batch)
+        else:
+            try:
+                for email in batch:
+                    message = EmailMultiAlternatives(
+                        email.subject, email.body, settings.DEFAULT_FROM_EMAIL, [email.to],
+                        connection=connection,
+                    )
+                    if email.html_body:
+                        message.attach_alternative(email.html_body, 'text/html')
+                    try:
+                        message.send()
+                    except Exception as exc:
+                        record_failure(email, exc, now)
+                        failed += 1
+                    else:
+                        email.attempts += 1
+                        email.status = 'sent'
+                        email.sent_at = timezone.now()
+                        email.last_error = ''
+                        sent += 1
+            finally:
+                connection.close()
+
+        OutboundEmail.objects.bulk_update(
+            batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+        )
+    return sent, failed
@@ -0,0 +1,72 @@
+import hashlib
+from datetime import date
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import models
+from django.utils.functional import cached_property
+
+
+def encode_cursor(invoice):
+    return f'{invoice.issue_date.isoformat()}_{invoice.pk}'
+
+
+def decode_cursor(cursor):
+    try:
+        day, pk = cursor.split('_')
+        return date.fromisoformat(day), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_paginate(invoices, after=None, before=None, page_size=50):
+    """
+    Page through invoices newest first by seeking on (issue_date, id) instead of
+    using OFFSET, so every page costs the same however deep it is.
+    Returns (page, next_cursor, previous_cursor); cursors are None at either end.
+    """
+    after = decode_cursor(after)
+    before = decode_cursor(before)
+
+    if before:
+        day, pk = before
+        rows = list(
+            invoices.filter(models.Q(issue_date__gt=day) | models.Q(issue_date=day, pk__gt=pk))
+            .order_by('issue_date', 'id')[:page_size + 1]
+        )
+        has_previous = len(rows) > page_size
+        page = rows[:page_size][::-1]
+        next_cursor = encode_cursor(page[-1]) if page else None
+        previous_cursor = encode_cursor(page[0]) if page and has_previous else None
+        return page, next_cursor, previous_cursor
+
+    if after:
+        day, pk = after
+        invoices = invoices.filter(models.Q(issue_date__lt=day) | models.Q(issue_date=day, pk__lt=pk))
+    rows = list(invoices.order_by('-issue_date', '-id')[:page_size + 1])
+    page = rows[:page_size]
+    next_cursor = encode_cursor(page[-1]) if len(rows) > page_size else None
+    previous_cursor = encode_cursor(page[0]) if page and after else None
+    return page, next_cursor, previous_cursor
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that keeps the COUNT(*) of each distinct query in the cache for
+    ADMIN_COUNT_CACHE_TIMEOUT seconds. Page numbers may trail inserts by that
+    long; with the default of 0 it counts on every request like Paginator.
+    """
+
+    @cached_property
+    def count(self):
+        timeout = getattr(settings, 'ADMIN_COUNT_CACHE_TIMEOUT', 0)
+        query = getattr(self.object_list, 'query', None)
+        if not timeout or query is None:
+            return super().count
+        sql, params = query.sql_with_params()
+        key = 'admin-count:' + hashlib.sha256(repr((sql, params)).encode('utf-8')).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, timeout)
+        return count
@@ -0,0 +1,216 @@
+"""
+Invoice PDF rendering. xhtml2pdf runs in a bounded process pool and invoice
+PDFs are cached in the ``INVOICE_PDF_CACHE`` cache alias, keyed by a
+fingerprint of everything the PDF shows.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import threading
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from .models import Invoice
+from .pdf_worker import html_to_pdf
+
+LOGO_URL = "https://icta.go.ke//assets/images/ictalogo.png"
+
+
+def format_currency(value):
+    """Format currency with commas for PDF"""
+    try:
+        return "{:,.2f}".format(float(value))
+    except (ValueError, TypeError):
+        return str(value)
+
+
+def pdf_cache():
+    return caches[getattr(settings, 'INVOICE_PDF_CACHE', 'default')]
+
+
+def invoice_pdf_key(invoice_id, fingerprint=None):
+    if fingerprint is None:
+        return f'invoice_pdf:{invoice_id}'
+    return f'invoice_pdf:{invoice_id}:{fingerprint}'
+
+
+def invoice_pdf_queryset():
+    """Invoices with everything the PDF template reads loaded up front"""
+    return Invoice.objects.select_related('user__userprofile').prefetch_related('items', 'participants')
+
+
+def invoice_pdf_fingerprint(invoice):
+    """Hash the invoice fields, items and participant set shown in the PDF"""
+    user = invoice.user
+    profile = user.userprofile
+    parts = [
+        invoice.updated_at.isoformat(), invoice.status, invoice.payment_date, invoice.payment_reference,
+        invoice.subtotal, invoice.tax_amount, invoice.total_amount, invoice.due_date, invoice.notes,
+        user.username, user.email, profile.company_name, profile.address, profile.phone,
+    ]
+    parts += sorted(
+        (item.id, item.description, item.quantity, item.unit_price, item.total)
+        for item in invoice.items.all()
+    )
+    parts += sorted(
+        (participant.id, participant.name, participant.email, participant.phone)
+        for participant in invoice.participants.all()
+    )
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+class PdfRenderUnavailable(Exception):
+    """Raised when the render pool is saturated or a job exceeds its timeout"""
+
+
+class PdfRenderer:
+    """
+    Process pool for xhtml2pdf with a cap on running plus queued jobs. A job
+    that overruns the timeout cannot be stopped on its own, so its pool is
+    killed and a fresh one started for the next job, which frees the slots
+    a hung render would otherwise hold for good.
+    """
+
+    def __init__(self, workers=None, queue_limit=None, timeout=None):
+        self.workers = workers or getattr(settings, 'PDF_RENDER_WORKERS', 2)
+        self.queue_limit = queue_limit if queue_limit is not None else getattr(settings, 'PDF_RENDER_QUEUE_LIMIT', 8)
+        self.timeout = timeout or getattr(settings, 'PDF_RENDER_TIMEOUT', 30)
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue_limit)
+        self.lock = threading.Lock()
+        self.executor = None
+        # Jobs holding a slot, with the pool running them
+        self.jobs = {}
+
+    def start(self):
+        """Create the worker pool if it is not running yet"""
+        with self.lock:
+            if self.executor is None:
+                self.executor = futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self.executor
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+    def submit(self, html_string):
+        """Queue a render job, refusing it straight away when the pool is full"""
+        if not self.slots.acquire(blocking=False):
+            raise PdfRenderUnavailable('PDF renderer is at capacity')
+        try:
+            executor = self.start()
+            future = executor.submit(html_to_pdf, html_string)
+        except BrokenProcessPool:
+            self.slots.release()
+            self.shutdown()
+            raise PdfRenderUnavailable('PDF renderer pool was restarted')
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.jobs[future] = executor
+        future.add_done_callback(self.release)
+        return future
+
+    def release(self, future):
+        """Give back a job's slot, once however many times it is called"""
+        with self.lock:
+            if self.jobs.pop(future, None) is None:
+                return
+        self.slots.release()
+
+    def recycle(self, future):
+        """Kill the pool running an overrunning job; its other jobs fail with BrokenProcessPool"""
+        with self.lock:
+            executor = self.jobs.get(future)
+            if executor is None:
+                return
+            if self.executor is executor:
+                self.executor = None
+            stranded = [job for job, pool in self.jobs.items() if pool is executor]
+        # ProcessPoolExecutor has no public way to stop a running job before Python 3.14
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False)
+        for job in stranded:
+            self.release(job)
+
+    def render(self, html_string):
+        """Render HTML to PDF bytes, blocking the calling thread up to the timeout"""
+        future = self.submit(html_string)
+        try:
+            return future.result(timeout=self.timeout)
+        except futures.TimeoutError:
+            self.recycle(future)
+            raise PdfRenderUnavailable('PDF rendering timed out')
+        except BrokenProcessPool:
+            raise PdfRenderUnavailable('PDF renderer pool was restarted')
+
+    async def arender(self, html_string):
+        """Render HTML to PDF bytes without blocking the event loop"""
+        future = self.submit(html_string)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.recycle(future)
+            raise PdfRenderUnavailable('PDF rendering timed out')
+        except BrokenProcessPool:
+            raise PdfRenderUnavailable('PDF renderer pool was restarted')
+
+
+pdf_renderer = PdfRenderer()
+
+
+def render_invoice_html(invoice):
+    """Render the invoice PDF template to an HTML string"""
+    # Add formatted versions as new attributes without overwriting originals
+    invoice.subtotal_formatted = format_currency(invoice.subtotal)
+    invoice.tax_amount_formatted = format_currency(invoice.tax_amount)
+    invoice.total_amount_formatted = format_currency(invoice.total_amount)
+
+    return render_to_string('invoices/invoice_pdf.html', {
+        'invoice': invoice,
+        'logo_url': LOGO_URL,
+    })
+
+
+def store_invoice_pdf(invoice_id, fingerprint, content):
+    """Cache a rendered PDF, replacing any older entry for the invoice"""
+    timeout = getattr(settings, 'INVOICE_PDF_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+    invalidate_invoice_pdf(invoice_id)
+    pdf_cache().set_many({
+        invoice_pdf_key(invoice_id): fingerprint,
+        invoice_pdf_key(invoice_id, fingerprint): content,
+    }, timeout)
+
+
+async def aget_invoice_pdf(invoice):
+    """Return the PDF for an invoice, rendering it in the pool only on a cache miss"""
+    fingerprint = await sync_to_async(invoice_pdf_fingerprint)(invoice)
+    content = await pdf_cache().aget(invoice_pdf_key(invoice.pk, fingerprint))
+    if content is not None:
+        return content
+
+    html_string = await sync_to_async(render_invoice_html)(invoice)
+    content = await pdf_renderer.arender(html_string)
+    if content is not None:
+        await sync_to_async(store_invoice_pdf)(invoice.pk, fingerprint, content)
+    return content
+
+
+def invalidate_invoice_pdf(*invoice_ids):
+    """Drop the cached PDFs for the given invoices"""
+    cache = pdf_cache()
+    pointers = cache.get_many([invoice_pdf_key(invoice_id) for invoice_id in invoice_ids])
+    if not pointers:
+        return
+    keys = list(pointers)
+    keys += [f'{key}:{fingerprint}' for key, fingerprint in pointers.items()]
+    cache.delete_many(keys)
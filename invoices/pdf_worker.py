@@ -0,0 +1,15 @@
+"""
+PDF conversion that runs inside the render pool processes. Kept free of Django
+imports so spawned workers can load it without configuring settings.
+"""
+from io import BytesIO
+from xhtml2pdf import pisa
+
+
+def html_to_pdf(html_string):
+    """Convert an HTML document to PDF bytes, or None if xhtml2pdf reports errors"""
+    result = BytesIO()
+    pdf = pisa.pisaDocument(BytesIO(html_string.encode("UTF-8")), result)
+    if pdf.err:
+        return None
+    return result.getvalue()
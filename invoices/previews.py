@@ -0,0 +1,107 @@
+"""
+Small JPEG previews of proof of payment files for the admin pages. The
+generate_proof_previews worker renders each stored proof once, writes the
+preview next to the original as ``<proof>.preview.jpg`` and records it in
+ProofPreview. Admin querysets pick the preview up with with_proof_preview().
+
+Images are read with Pillow; PDFs need the optional pypdfium2 package to
+rasterise their first page. Files that cannot be rendered are recorded
+without a preview, and the admin falls back to a plain link.
+"""
+import logging
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models
+from .models import Invoice, ProofPreview
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'bmp']
+
+
+def preview_size():
+    return getattr(settings, 'PROOF_PREVIEW_SIZE', (300, 300))
+
+
+def preview_name(name):
+    return f'{name}.preview.jpg'
+
+
+def with_proof_preview(invoices):
+    """Annotate each invoice with the storage name of its proof preview, or None"""
+    return invoices.annotate(proof_preview=models.Subquery(
+        ProofPreview.objects.filter(source=models.OuterRef('proof_of_payment')).values('preview')[:1]
+    ))
+
+
+def preview_url(invoice):
+    """URL of the annotated preview, or None while it is missing"""
+    preview = getattr(invoice, 'proof_preview', None)
+    return default_storage.url(preview) if preview else None
+
+
+def open_first_page(proof):
+    """The proof as a PIL image; PDFs are rasterised from their first page"""
+    extension = proof.name.rsplit('.', 1)[-1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return Image.open(proof)
+    if extension == 'pdf' and pdfium is not None:
+        document = pdfium.PdfDocument(proof.read())
+        try:
+            # Scale the page so its longer side lands near the preview size
+            page = document[0]
+            scale = max(preview_size()) / max(page.get_size())
+            return page.render(scale=max(scale, 0.1)).to_pil()
+        finally:
+            document.close()
+    return None
+
+
+def render_preview(name):
+    """Write the preview for a stored proof; return its name, or '' when it cannot be rendered"""
+    if Image is None:
+        return ''
+    try:
+        with default_storage.open(name) as proof:
+            image = open_first_page(proof)
+            if image is None:
+                return ''
+            image.thumbnail(preview_size())
+            output = BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=80)
+    except Exception:
+        logger.exception('Could not render a preview of %s', name)
+        return ''
+    target = preview_name(name)
+    default_storage.delete(target)
+    return default_storage.save(target, ContentFile(output.getvalue()))
+
+
+def missing_preview_sources(limit):
+    """Stored proof names that have no preview attempt recorded yet"""
+    return list(
+        Invoice.objects.exclude(proof_of_payment='')
+        .exclude(proof_of_payment__in=ProofPreview.objects.values('source'))
+        .values_list('proof_of_payment', flat=True).distinct()[:limit]
+    )
+
+
+def generate_missing_previews(batch_size=20):
+    """Render one batch of missing previews; return how many proofs were handled"""
+    sources = missing_preview_sources(batch_size)
+    for source in sources:
+        # Proofs shared by content hash are rendered once for every invoice using them
+        ProofPreview.objects.get_or_create(source=source, defaults={'preview': render_preview(source)})
+    return len(sources)
@@ -0,0 +1,285 @@
+"""
+Invoice pricing. Tier definitions come from the INVOICE_PRICING setting, one
+list per event, and INVOICE_PRICING_EVENT names the event invoices are priced
+for. Each tier covers a range of group sizes (min to max, max omitted for
+open-ended), may be limited to a date window (starts/ends, for early-bird
+rates) and charges either a unit_price per participant or a flat total for the
+group. Its notes and description are format strings taking {count}.
+
+Tiers may overlap. A tier with a date window wins over one without, so an
+early-bird rate can be listed anywhere next to the standard one; otherwise
+the first tier listed wins.
+
+The tiers in force on a given day are compiled into a table indexed by group
+size and kept, so quote() is a lookup. reprice_invoices() applies pricing to
+many invoices with a fixed number of queries, and reprice_open_invoices()
+walks every unpaid invoice that way in chunks. Line items are reconciled
+against the quote rather than rewritten, so unchanged items cost no writes.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import QuerySet
+from django.dispatch import receiver
+from django.utils import timezone
+
+DEFAULT_EVENT = 'apay-summit'
+DEFAULT_PRICING = {
+    DEFAULT_EVENT: [
+        {
+            'min': 1, 'max': 3, 'unit_price': 15000,
+            'notes': 'Payment for {count} participant(s) - Individual Rate (KES 15,000 per person)',
+            'description': 'Individual Registration - {count} participant(s)',
+        },
+        {
+            'min': 4, 'max': 4, 'total': 45000,
+            'notes': 'Payment for {count} participant(s) - Special Group Rate (KES 45,000 total)',
+            'description': 'Group Registration - {count} participants (Special Rate)',
+        },
+        {
+            'min': 5, 'unit_price': 11000,
+            'notes': 'Payment for {count} participant(s) - Group Rate (KES 11,000 per person)',
+            'description': 'Group Registration - {count} participant(s)',
+        },
+    ],
+}
+EMPTY_NOTES = 'Add participants to generate invoice'
+CENTS = Decimal('0.01')
+PRICED_FIELDS = ['participant_count', 'subtotal', 'tax_amount', 'total_amount', 'notes', 'updated_at']
+ITEM_FIELDS = ['description', 'quantity', 'unit_price', 'total']
+
+
+class QuoteItem(NamedTuple):
+    description: str
+    quantity: int
+    unit_price: Decimal
+    total: Decimal
+
+
+class Quote(NamedTuple):
+    subtotal: Decimal
+    tax_amount: Decimal
+    total_amount: Decimal
+    notes: str
+    items: list
+
+
+EMPTY_QUOTE = Quote(Decimal(0), Decimal(0), Decimal(0), EMPTY_NOTES, [])
+
+
+def pricing_event():
+    return getattr(settings, 'INVOICE_PRICING_EVENT', DEFAULT_EVENT)
+
+
+def event_tiers(event):
+    pricing = getattr(settings, 'INVOICE_PRICING', DEFAULT_PRICING)
+    if event not in pricing:
+        raise ImproperlyConfigured(f'INVOICE_PRICING has no tiers for event {event!r}')
+    return pricing[event]
+
+
+def as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def in_window(tier, on):
+    starts, ends = as_date(tier.get('starts')), as_date(tier.get('ends'))
+    return (starts is None or starts <= on) and (ends is None or on <= ends)
+
+
+class PricingTable:
+    """The tiers in force on one day, with the tier for every group size up to the largest bound worked out"""
+
+    def __init__(self, event, tiers):
+        self.event = event
+        # Overlapping tiers: windowed ones first, then in the order listed (the sort is stable)
+        tiers = sorted(tiers, key=lambda tier: not (tier.get('starts') or tier.get('ends')))
+        # Past the largest min or max, only open-ended tiers can match, and the first of them always does
+        self.bound = max([tier['min'] for tier in tiers] + [tier['max'] for tier in tiers if tier.get('max')], default=0)
+        self.sizes = [None] + [self.match(tiers, count) for count in range(1, self.bound + 1)]
+        self.overflow = next((tier for tier in tiers if tier.get('max') is None), None)
+
+    @staticmethod
+    def match(tiers, count):
+        return next((tier for tier in tiers if tier['min'] <= count <= (tier.get('max') or count)), None)
+
+    def tier(self, count):
+        tier = self.sizes[count] if count <= self.bound else self.overflow
+        if tier is None:
+            raise ImproperlyConfigured(f'No {self.event!r} pricing tier covers {count} participants')
+        return tier
+
+
+@lru_cache(maxsize=128)
+def pricing_table(event, on):
+    return PricingTable(event, [tier for tier in event_tiers(event) if in_window(tier, on)])
+
+
+@receiver(setting_changed)
+def clear_pricing_tables(setting, **kwargs):
+    if setting in ('INVOICE_PRICING', 'INVOICE_PRICING_EVENT'):
+        pricing_table.cache_clear()
+
+
+def quote(participant_count, on=None, event=None):
+    """Amounts, notes and line items for a group of participant_count registered on the given day"""
+    if participant_count <= 0:
+        return EMPTY_QUOTE
+    tier = pricing_table(event or pricing_event(), on or date.today()).tier(participant_count)
+    if 'total' in tier:
+        subtotal = Decimal(str(tier['total']))
+        unit_price = (subtotal / participant_count).quantize(CENTS)
+    else:
+        unit_price = Decimal(str(tier['unit_price']))
+        subtotal = unit_price * participant_count
+    tax_amount = Decimal(0)  # VAT is exclusive
+    item = QuoteItem(tier['description'].format(count=participant_count), participant_count, unit_price, subtotal)
+    return Quote(subtotal, tax_amount, subtotal + tax_amount, tier['notes'].format(count=participant_count), [item])
+
+
+def quote_invoice(invoice):
+    """Quote an invoice's stored participant_count at the rates in force on its issue date"""
+    return quote(invoice.participant_count, on=invoice.issue_date)
+
+
+def apply_quote(invoice, quote):
+    """Copy a quote's amounts and notes onto the invoice; return whether any of them changed"""
+    before = [Decimal(str(amount)) for amount in (invoice.subtotal, invoice.tax_amount, invoice.total_amount)]
+    changed = before != list(quote[:3]) or invoice.notes != quote.notes
+    invoice.subtotal, invoice.tax_amount, invoice.total_amount, invoice.notes = quote[:4]
+    return changed
+
+
+def item_values(item):
+    return QuoteItem(item.description, item.quantity, Decimal(str(item.unit_price)), Decimal(str(item.total)))
+
+
+def reconcile_items(targets):
+    """
+    Bring the stored items of each invoice in targets ({invoice: quoted
+    items}) in line with its quote, pairing stored and quoted items in
+    order. Items that already match are not written, differing ones are
+    updated in place, and only surplus or missing ones are deleted or
+    created. Sends invoice_items_changed for the invoices whose items were
+    written and returns them.
+    """
+    from .models import InvoiceItem, invoice_items_changed
+
+    stored = defaultdict(list)
+    for item in InvoiceItem.objects.filter(invoice__in=targets).order_by('invoice_id', 'id'):
+        stored[item.invoice_id].append(item)
+    created, updated, deleted = [], [], []
+    touched = []
+    for invoice, quoted in targets.items():
+        items = stored[invoice.pk]
+        changed = []
+        for item, target in zip(items, quoted):
+            if item_values(item) != target:
+                item.description, item.quantity, item.unit_price, item.total = target
+                changed.append(item)
+        updated += changed
+        created += [InvoiceItem(invoice=invoice, **target._asdict()) for target in quoted[len(items):]]
+        deleted += items[len(quoted):]
+        if changed or len(items) != len(quoted):
+            touched.append(invoice)
+
+    if updated:
+        InvoiceItem.objects.bulk_update(updated, ITEM_FIELDS)
+    if created:
+        InvoiceItem.objects.bulk_create(created)
+    if deleted:
+        InvoiceItem.objects.filter(pk__in=[item.pk for item in deleted]).delete()
+    if touched:
+        invoice_items_changed.send(sender=InvoiceItem, invoices=touched, created=created, updated=updated, deleted=deleted)
+    return touched
+
+
+def reprice_invoices(invoices):
+    """
+    Apply current pricing to a batch of invoices (a queryset or instances),
+    writing only what moved. The rows are locked and re-read with their
+    participants counted from the membership table, so a concurrent add
+    cannot be overwritten with an older count; then one bulk_update covers
+    the invoices whose count, amounts or notes changed and one reconcile
+    their items. Returns the invoices whose own fields changed.
+    """
+    from .fragments import bump_data_version
+    from .models import NO_STATS, DashboardStats, Invoice, actual_participant_count, invoice_contribution, subtract_stats
+    from .pdf import invalidate_invoice_pdf
+
+    ids = invoices.values('pk') if isinstance(invoices, QuerySet) else [invoice.pk for invoice in invoices]
+    now = timezone.now()
+    deltas = dict.fromkeys(NO_STATS, 0)
+    changed = []
+    targets = {}
+    with transaction.atomic():
+        locked = (
+            Invoice.objects.select_for_update(of=('self',))
+            .filter(pk__in=ids)
+            .annotate(actual_count=actual_participant_count())
+            .order_by('id')
+        )
+        for invoice in locked:
+            recounted = invoice.actual_count != invoice.participant_count
+            invoice.participant_count = invoice.actual_count
+            invoice_quote = quote_invoice(invoice)
+            targets[invoice] = invoice_quote.items
+            before = invoice_contribution(invoice.status, invoice.total_amount)
+            if apply_quote(invoice, invoice_quote) or recounted:
+                invoice.updated_at = now
+                changed.append(invoice)
+                for field, delta in subtract_stats(invoice_contribution(invoice.status, invoice.total_amount), before).items():
+                    deltas[field] += delta
+        if changed:
+            Invoice.objects.bulk_update(changed, PRICED_FIELDS)
+            # bulk_update skips the post_save receivers, so do their work once for the batch
+            DashboardStats.apply(deltas)
+            invalidate_invoice_pdf(*(invoice.pk for invoice in changed))
+            bump_data_version(*{invoice.user_id for invoice in changed})
+        if targets:
+            reconcile_items(targets)
+    return changed
+
+
+def priced_values(invoice):
+    return invoice.participant_count, Decimal(str(invoice.total_amount)), invoice.notes
+
+
+def reprice_open_invoices(batch_size=500, dry_run=False):
+    """
+    Reprice every pending or overdue invoice from its actual participant
+    count, one committed chunk at a time in id order. Yields (number of
+    invoices in the chunk, changes), each change being (invoice, before,
+    after) with priced_values() on either side. With dry_run nothing is
+    written or locked.
+    """
+    from .models import UNPAID_STATUSES, Invoice, actual_participant_count
+
+    invoices = Invoice.objects.filter(status__in=UNPAID_STATUSES).annotate(actual_count=actual_participant_count())
+    last = 0
+    while True:
+        chunk = list(invoices.filter(pk__gt=last).order_by('id')[:batch_size])
+        if not chunk:
+            return
+        last = chunk[-1].pk
+        before = {invoice.pk: priced_values(invoice) for invoice in chunk}
+        if dry_run:
+            for invoice in chunk:
+                invoice.participant_count = invoice.actual_count
+                apply_quote(invoice, quote_invoice(invoice))
+            after = chunk
+        else:
+            # Locks the chunk and re-reads it; invoices paid since are left alone
+            after = reprice_invoices(Invoice.objects.filter(pk__in=before, status__in=UNPAID_STATUSES))
+        changes = [
+            (invoice, before[invoice.pk], priced_values(invoice))
+            for invoice in after
+            if before[invoice.pk] != priced_values(invoice)
+        ]
+        yield len(chunk), changes
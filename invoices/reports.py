@@ -0,0 +1,93 @@
+import csv
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models
+from .models import Invoice
+
+
+def build_user_summary():
+    """Build the per-user participant/invoice summary in two grouped queries"""
+    users = User.objects.filter(
+        participants__isnull=False
+    ).annotate(
+        participant_count=models.Count('participants')
+    ).order_by('id')
+
+    invoice_totals = {
+        row['user']: row
+        for row in Invoice.objects.order_by().values('user').annotate(
+            invoice_count=models.Count('id'),
+            paid_count=models.Count('id', filter=models.Q(status='paid')),
+            amount=models.Sum('total_amount'),
+            paid_amount=models.Sum('total_amount', filter=models.Q(status='paid')),
+        )
+    }
+
+    user_summary = {}
+    for user in users:
+        totals = invoice_totals.get(user.id, {})
+        user_summary[user.id] = {
+            'user': user,
+            'participant_count': user.participant_count,
+            'total_invoices': totals.get('invoice_count', 0),
+            'paid_invoices': totals.get('paid_count', 0),
+            'total_amount': totals.get('amount') or 0,
+            'total_paid_amount': totals.get('paid_amount') or 0,
+        }
+    return user_summary
+
+
+def with_invoice_list(participants):
+    """Prefetch each participant's invoices onto ``participant.invoice_list``"""
+    return participants.prefetch_related(
+        models.Prefetch('invoice_set', queryset=Invoice.objects.order_by('id'), to_attr='invoice_list')
+    )
+
+
+def total_paid_for_registered_users():
+    """Sum paid invoices across every user that has registered participants"""
+    return Invoice.objects.filter(
+        status='paid',
+        user__in=User.objects.filter(participants__isnull=False),
+    ).aggregate(total=models.Sum('total_amount'))['total'] or 0
+
+
+class Echo:
+    """File-like object that returns what is written so csv rows can be yielded"""
+    def write(self, value):
+        return value
+
+
+def participants_csv_rows(participants):
+    """Yield the participants report as CSV lines, reading the queryset in chunks"""
+    chunk_size = getattr(settings, 'PARTICIPANTS_EXPORT_CHUNK_SIZE', 500)
+    writer = csv.writer(Echo())
+    yield writer.writerow([
+        'Participant Name', 'Email', 'Phone', 'Registered By',
+        'User Email', 'Invoice Count', 'Invoice Status', 'Total Amount',
+        'Paid Amount', 'Registration Date'
+    ])
+
+    participant_count = 0
+    for participant in with_invoice_list(participants).iterator(chunk_size=chunk_size):
+        user = participant.user
+        invoices = participant.invoice_list
+        participant_count += 1
+        yield writer.writerow([
+            participant.name,
+            participant.email,
+            participant.phone,
+            user.username,
+            user.email,
+            len(invoices),
+            ", ".join([inv.get_status_display() for inv in invoices]) if invoices else "No Invoice",
+            sum(inv.total_amount for inv in invoices),
+            sum(inv.total_amount for inv in invoices if inv.status == 'paid'),
+            participant.created_at.strftime('%Y-%m-%d')
+        ])
+
+    # Add summary rows
+    yield writer.writerow([])
+    yield writer.writerow(['SUMMARY', '', '', '', '', '', '', '', ''])
+    yield writer.writerow(['Total Participants', participant_count])
+    yield writer.writerow(['Total Paid Amount (All Users)', f"KES {total_paid_for_registered_users():,.2f}"])
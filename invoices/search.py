@@ -0,0 +1,128 @@
+"""
+Search for the admin invoice and participant lists.
+
+On SQLite, invoices and participants are mirrored into FTS5 tables using the
+trigram tokenizer, which answers substring queries from an index. The mirror is
+kept in sync by signal receivers in models.py and can be rebuilt with the
+rebuild_search_index command. On PostgreSQL, the icontains lookups are served by
+trigram GIN indexes created in migration 0010. Queries shorter than three
+characters, and other backends, use plain icontains filters.
+"""
+from django.contrib.auth.models import User
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+from .models import Invoice, Participant
+
+INVOICE_TABLE = 'invoices_invoice_search'
+PARTICIPANT_TABLE = 'invoices_participant_search'
+MIN_QUERY_LENGTH = 3
+
+_fts_ready = set()
+
+
+def fts_enabled():
+    """True when the FTS5 mirror tables exist on the current database"""
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias in _fts_ready:
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [INVOICE_TABLE])
+        found = cursor.fetchone() is not None
+    if found:
+        _fts_ready.add(connection.alias)
+    return found
+
+
+def invoice_document(invoice):
+    return '\n'.join([invoice.invoice_number, invoice.payment_reference, invoice.user.username, invoice.user.email])
+
+
+def participant_document(participant):
+    return '\n'.join([participant.name, participant.email, participant.phone, participant.user.username])
+
+
+def replace_rows(table, rows):
+    """Replace (rowid, body) rows in an FTS table"""
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {table} WHERE rowid = %s", [(rowid,) for rowid, body in rows])
+        cursor.executemany(f"INSERT INTO {table}(rowid, body) VALUES (%s, %s)", rows)
+
+
+def index_invoices(invoices):
+    if fts_enabled():
+        replace_rows(INVOICE_TABLE, [(invoice.pk, invoice_document(invoice)) for invoice in invoices])
+
+
+def index_participants(participants):
+    if fts_enabled():
+        replace_rows(PARTICIPANT_TABLE, [(participant.pk, participant_document(participant)) for participant in participants])
+
+
+def index_user(user):
+    """Refresh every document that embeds the user's username or email"""
+    if fts_enabled():
+        index_invoices(Invoice.objects.filter(user=user).select_related('user'))
+        index_participants(Participant.objects.filter(user=user).select_related('user'))
+
+
+def unindex(model, pk):
+    if fts_enabled():
+        table = INVOICE_TABLE if model is Invoice else PARTICIPANT_TABLE
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [pk])
+
+
+def rebuild_search_index():
+    """Repopulate the FTS tables from scratch; returns (invoices, participants) indexed"""
+    if not fts_enabled():
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INVOICE_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {INVOICE_TABLE}(rowid, body) "
+            "SELECT i.id, i.invoice_number || char(10) || i.payment_reference || char(10) || u.username || char(10) || u.email "
+            f"FROM {Invoice._meta.db_table} i JOIN {User._meta.db_table} u ON u.id = i.user_id"
+        )
+        invoice_total = cursor.rowcount
+        cursor.execute(f"DELETE FROM {PARTICIPANT_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {PARTICIPANT_TABLE}(rowid, body) "
+            "SELECT p.id, p.name || char(10) || p.email || char(10) || p.phone || char(10) || u.username "
+            f"FROM {Participant._meta.db_table} p JOIN {User._meta.db_table} u ON u.id = p.user_id"
+        )
+        participant_total = cursor.rowcount
+    return invoice_total, participant_total
+
+
+def match(table, query):
+    phrase = '"' + query.replace('"', '""') + '"'
+    return RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [phrase])
+
+
+def search_invoices(invoices, query):
+    """Filter invoices by number, payment reference, username or user email"""
+    if len(query) >= MIN_QUERY_LENGTH and fts_enabled():
+        return invoices.filter(pk__in=match(INVOICE_TABLE, query))
+    # Matching users in a subquery lets each column use its own trigram index
+    return invoices.filter(
+        models.Q(invoice_number__icontains=query) |
+        models.Q(payment_reference__icontains=query) |
+        models.Q(user__in=User.objects.filter(
+            models.Q(username__icontains=query) | models.Q(email__icontains=query)
+        ).values('pk'))
+    )
+
+
+def search_participants(participants, query):
+    """Filter participants by name, email, phone or registering username"""
+    if len(query) >= MIN_QUERY_LENGTH and fts_enabled():
+        return participants.filter(pk__in=match(PARTICIPANT_TABLE, query))
+    return participants.filter(
+        models.Q(name__icontains=query) |
+        models.Q(email__icontains=query) |
+        models.Q(phone__icontains=query) |
+        models.Q(user__in=User.objects.filter(username__icontains=query).values('pk'))
+    )
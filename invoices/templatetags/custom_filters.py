@@ -1,4 +1,5 @@
 from django import template
+from django.core.files.storage import default_storage
 
 register = template.Library()
 
@@ -26,4 +27,9 @@ def get_item(dictionary, key):
 
 @register.filter
 def get_field(form, field_name):
-    return form[field_name]
\ No newline at end of file
+    return form[field_name]
+
+@register.filter
+def storage_url(name):
+    """URL of a file name in the default storage"""
+    return default_storage.url(name)
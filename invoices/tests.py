@@ -1,3 +1,1136 @@
-from django.test import TestCase
+import importlib.util
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO, StringIO
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_views, pdf, previews, views
+from .dashboard import USER_DASHBOARD_KEYS, abuild_user_dashboard, build_user_dashboard
+from .models import (
+    DashboardStats, Invoice, InvoiceItem, InvoiceStatusChange, OutboundEmail, Participant, ProofPreview, ProofUpload,
+    invoice_items_changed,
+)
+from .uploads import MAX_PROOF_SIZE
+from .outbox import deliver_pending
+from .pagination import CachedCountPaginator
+from .pricing import QuoteItem, quote, reprice_invoices, reprice_open_invoices
+from .transitions import sweep_overdue, transition_invoices
+from .views import bulk_add_participants, calculate_pricing, update_invoice_amounts
+
+
+def make_company(username, participant_count=2, status='pending'):
+    """Create a user with participants attached to a single invoice"""
+    user = User.objects.create_user(username=username, email=f'{username}@example.com', password='pass')
+    invoice = Invoice.objects.create(
+        invoice_number=f'INV-{username.upper()}',
+        user=user,
+        due_date=date.today() + timedelta(days=30),
+        status=status,
+        subtotal=15000 * participant_count,
+        total_amount=15000 * participant_count,
+    )
+    for i in range(participant_count):
+        participant = Participant.objects.create(
+            user=user, name=f'{username} {i}', email=f'{username}{i}@example.com', phone='0712345678'
+        )
+        invoice.participants.add(participant)
+    return user, invoice
+
+
+class AdminParticipantsListTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='pass', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def count_queries(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin_participants_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_independent_of_user_count(self):
+        make_company('acme', status='paid')
+        make_company('globex')
+        baseline = self.count_queries()
+
+        for i in range(10):
+            make_company(f'company{i}', participant_count=3, status='paid' if i % 2 else 'pending')
+        self.assertEqual(self.count_queries(), baseline)
+
+    def test_user_summary_totals(self):
+        acme, _ = make_company('acme', status='paid')
+        make_company('globex', participant_count=3)
+
+        response = self.client.get(reverse('admin_participants_list'))
+        summary = response.context['user_summary'][acme.id]
+        self.assertEqual(summary['participant_count'], 2)
+        self.assertEqual(summary['total_invoices'], 1)
+        self.assertEqual(summary['paid_invoices'], 1)
+        self.assertEqual(summary['total_paid_amount'], 30000)
+        self.assertEqual(response.context['total_users'], 2)
+        self.assertEqual(response.context['total_paid_all_users'], 30000)
+
+    def test_search_only_loads_matching_participants(self):
+        make_company('acme')
+        make_company('globex')
+
+        response = self.client.get(reverse('admin_participants_list'), {'search': 'globex'})
+        participants = response.context['participants']
+        self.assertEqual(len(participants), 2)
+        self.assertEqual([inv.invoice_number for inv in participants[0].invoice_list], ['INV-GLOBEX'])
+
+    def test_csv_export_streams_rows_and_summary(self):
+        make_company('acme', status='paid')
+        make_company('globex', participant_count=3)
+
+        response = self.client.get(reverse('admin_participants_list'), {'export': 'csv'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1 + 5 + 4)
+        self.assertIn('acme 0,acme0@example.com,0712345678,acme,acme@example.com,1,Paid,30000.00,30000.00', lines[1])
+        self.assertEqual(lines[-2], 'Total Participants,5')
+        self.assertEqual(lines[-1], 'Total Paid Amount (All Users),"KES 30,000.00"')
+
+
+class InvoicePdfCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user, self.invoice = make_company('acme')
+        update_invoice_amounts(self.invoice)
+        self.client.force_login(self.user)
+
+    def download(self):
+        with mock.patch.object(pdf.pdf_renderer, 'arender', wraps=pdf.pdf_renderer.arender) as render:
+            response = self.client.get(reverse('download_invoice', args=[self.invoice.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        return response.content, render.call_count
+
+    def test_repeat_download_is_served_from_cache(self):
+        first, renders = self.download()
+        self.assertEqual(renders, 1)
+        second, renders = self.download()
+        self.assertEqual(renders, 0)
+        self.assertEqual(first, second)
+
+    def test_updating_amounts_invalidates_cached_pdf(self):
+        self.download()
+        participant = Participant.objects.create(user=self.user, name='New', email='new@example.com', phone='0712345678')
+        self.invoice.participants.add(participant)
+        update_invoice_amounts(self.invoice)
+        self.assertIsNone(cache.get(pdf.invoice_pdf_key(self.invoice.id)))
+        self.assertEqual(self.download()[1], 1)
+
+    def test_admin_status_action_invalidates_cached_pdf(self):
+        from .admin import InvoiceAdmin
+        from django.contrib.admin.sites import site
+
+        self.download()
+        InvoiceAdmin(Invoice, site).update_invoices(Invoice.objects.filter(id=self.invoice.id), status='paid')
+        self.assertIsNone(cache.get(pdf.invoice_pdf_key(self.invoice.id)))
+        self.assertEqual(self.download()[1], 1)
+
+
+class PdfRendererTests(TestCase):
+    def test_jobs_beyond_queue_limit_are_refused(self):
+        renderer = pdf.PdfRenderer(workers=1, queue_limit=1, timeout=60)
+        self.addCleanup(renderer.shutdown)
+        html = '<html><body><p>Invoice</p></body></html>'
+
+        running = renderer.submit(html)
+        queued = renderer.submit(html)
+        with self.assertRaises(pdf.PdfRenderUnavailable):
+            renderer.submit(html)
+        self.assertTrue(running.result(timeout=60).startswith(b'%PDF'))
+        self.assertTrue(queued.result(timeout=60).startswith(b'%PDF'))
+
+    def test_hung_render_is_killed_and_the_next_one_succeeds(self):
+        renderer = pdf.PdfRenderer(workers=1, queue_limit=0, timeout=1)
+        self.addCleanup(renderer.shutdown)
+        # time.sleep pickles by reference, so it stands in for a render stuck in the worker
+        with mock.patch.object(pdf, 'html_to_pdf', time.sleep):
+            with self.assertRaises(pdf.PdfRenderUnavailable):
+                renderer.render(600)
+        renderer.timeout = 60
+        self.assertTrue(renderer.render('<html><body><p>Invoice</p></body></html>').startswith(b'%PDF'))
+
+    def test_saturated_renderer_returns_503(self):
+        cache.clear()
+        user, invoice = make_company('acme')
+        self.client.force_login(user)
+        with mock.patch.object(pdf.pdf_renderer, 'arender', side_effect=pdf.PdfRenderUnavailable):
+            response = self.client.get(reverse('download_invoice', args=[invoice.id]))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '10')
+
+
+class OutboxTests(TestCase):
+    def register(self):
+        return self.client.post(reverse('register'), {
+            'username': 'acme', 'email': 'acme@example.com',
+            'password1': 'S3cure-pass-123', 'password2': 'S3cure-pass-123',
+        })
+
+    def test_registration_queues_verification_email(self):
+        self.assertEqual(self.register().status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.to, 'acme@example.com')
+
+        self.assertEqual(deliver_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives[0].mimetype, 'text/html')
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'sent')
+        self.assertEqual(deliver_pending(), (0, 0))
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        email = OutboundEmail.objects.create(to='acme@example.com', subject='Hi', body='Hello')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            self.assertEqual(deliver_pending(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), ('pending', 1, 'down'))
+        self.assertGreater(email.next_attempt_at, email.created_at)
+        self.assertEqual(deliver_pending(), (0, 0))
+
+        OutboundEmail.objects.update(attempts=4, next_attempt_at=email.created_at)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            deliver_pending()
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'failed')
+
+
+class BulkParticipantImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='acme', email='acme@example.com', password='pass')
+        self.client.force_login(self.user)
+
+    def post_lines(self, lines):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('add_participant'), {
+                'multiple_submit': '1', 'participants_data': '\n'.join(lines),
+            })
+        self.assertEqual(response.status_code, 302)
+        return len(ctx.captured_queries)
+
+    def test_import_uses_constant_number_of_queries(self):
+        self.post_lines(['First Person,first@example.com,0712345678'])
+        small = self.post_lines([f'Person {i},p{i}@example.com,07123456{i:02d}' for i in range(3)])
+        large = self.post_lines([f'Guest {i},g{i}@example.com,07123456{i:02d}' for i in range(60)])
+        self.assertEqual(small, large)
+
+        invoice = Invoice.objects.get(user=self.user)
+        self.assertEqual(invoice.participants.count(), 64)
+        self.assertEqual(invoice.total_amount, 11000 * 64)
+        self.assertEqual(invoice.items.get().quantity, 64)
+
+    def test_invalid_lines_are_reported_and_skipped(self):
+        self.post_lines([
+            'Jane Doe,jane@example.com,0712345678',
+            'No Email,,0712345678',
+            'Bad Email,not-an-email,0712345678',
+            'Too,Many,Fields,Here',
+        ])
+        self.assertEqual(list(Participant.objects.values_list('name', flat=True)), ['Jane Doe'])
+        self.assertEqual(Invoice.objects.get(user=self.user).total_amount, 15000)
+
+    def upload(self, content, name='participants.csv'):
+        return self.client.post(reverse('add_participant'), {
+            'file_submit': '1', 'participants_file': SimpleUploadedFile(name, content),
+        })
+
+    def test_csv_upload_handles_header_and_quoted_names(self):
+        response = self.upload(
+            b'\xef\xbb\xbfName,Email,Phone\r\n'
+            b'"Doe, John",john@example.com,0712345678\r\n'
+            b'Jane Smith,jane@example.com,0723456789\r\n'
+        )
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(sorted(Participant.objects.values_list('name', flat=True)), ['Doe, John', 'Jane Smith'])
+        self.assertEqual(Invoice.objects.get(user=self.user).total_amount, 30000)
+
+    def test_csv_upload_reports_invalid_rows(self):
+        response = self.upload(b'Jane Smith,jane@example.com,0723456789\nBad,not-an-email,0712345678\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['import_errors']), 1)
+        self.assertTrue(response.context['import_errors'][0].startswith('Line 2: email:'))
+        self.assertEqual(Participant.objects.count(), 1)
+
+    def test_unreadable_upload_imports_nothing(self):
+        response = self.upload(b'Jane Smith,jane@example.com,0723456789\n\xff\xfe,bad,row\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Nothing was imported.', str(response.context['file_form'].errors))
+        self.assertFalse(Participant.objects.exists())
+
+    def xlsx(self, rows):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        content = BytesIO()
+        workbook.save(content)
+        return content.getvalue()
+
+    @skipUnless(importlib.util.find_spec('openpyxl'), 'Excel uploads need openpyxl')
+    def test_xlsx_upload_imports_the_first_sheet(self):
+        response = self.upload(self.xlsx([
+            ['Name', 'Email', 'Phone'],
+            ['Jane Smith', 'jane@example.com', '0723456789'],
+            ['John Doe', 'john@example.com', 712345678],
+        ]), name='participants.xlsx')
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(sorted(Participant.objects.values_list('name', flat=True)), ['Jane Smith', 'John Doe'])
+        self.assertEqual(Invoice.objects.get(user=self.user).total_amount, 30000)
+
+    @skipUnless(importlib.util.find_spec('openpyxl'), 'Excel uploads need openpyxl')
+    def test_corrupt_xlsx_sheet_imports_nothing(self):
+        valid = zipfile.ZipFile(BytesIO(self.xlsx([['Jane Smith', 'jane@example.com', '0723456789']])))
+        content = BytesIO()
+        # The workbook opens, but its sheet XML is cut short
+        with zipfile.ZipFile(content, 'w') as corrupt:
+            for info in valid.infolist():
+                data = valid.read(info)
+                if info.filename == 'xl/worksheets/sheet1.xml':
+                    data = data[:len(data) // 2]
+                corrupt.writestr(info, data)
+        response = self.upload(content.getvalue(), name='participants.xlsx')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Nothing was imported.', str(response.context['file_form'].errors))
+        self.assertFalse(Participant.objects.exists())
+
+
+@skipUnless(connection.features.has_select_for_update, 'Row locking needs a database with SELECT ... FOR UPDATE')
+class ConcurrentParticipantAddTests(TransactionTestCase):
+    def test_parallel_adds_share_one_invoice_with_correct_totals(self):
+        user = User.objects.create_user(username='acme', email='acme@example.com', password='pass')
+        workers = 8
+        barrier = threading.Barrier(workers)
+        failures = []
+
+        def add(i):
+            try:
+                barrier.wait()
+                participant = Participant(name=f'Person {i}', email=f'p{i}@example.com', phone='0712345678')
+                bulk_add_participants(user, [participant])
+            except Exception as exc:
+                failures.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add, args=(i,)) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(failures, [])
+        invoice = Invoice.objects.get(user=user)
+        self.assertEqual(invoice.participants.count(), workers)
+        self.assertEqual(invoice.total_amount, calculate_pricing(workers))
+        self.assertEqual(invoice.items.get().quantity, workers)
+
+
+class ParticipantCountTests(TestCase):
+    def setUp(self):
+        self.user, self.invoice = make_company('acme', participant_count=3)
+
+    def stored_count(self):
+        return Invoice.objects.values_list('participant_count', flat=True).get(pk=self.invoice.pk)
+
+    def test_counter_follows_membership_changes(self):
+        self.assertEqual(self.stored_count(), 3)
+        extra = Participant.objects.create(user=self.user, name='Extra', email='x@example.com', phone='0712345678')
+        extra.invoice_set.add(self.invoice)
+        self.assertEqual(self.stored_count(), 4)
+
+        self.invoice.participants.remove(extra)
+        self.assertEqual(self.stored_count(), 3)
+        Participant.objects.filter(user=self.user).first().delete()
+        self.assertEqual(self.stored_count(), 2)
+        self.invoice.participants.clear()
+        self.assertEqual(self.stored_count(), 0)
+
+    def test_saving_a_stale_instance_keeps_the_stored_count(self):
+        extra = Participant.objects.create(user=self.user, name='Extra', email='x@example.com', phone='0712345678')
+        self.invoice.participants.add(extra)
+        # The in-memory instance still holds the count it was loaded with
+        self.invoice.mark_as_paid('REF-1')
+        self.assertEqual(self.stored_count(), 4)
+        self.assertEqual(Invoice.objects.get(pk=self.invoice.pk).status, 'paid')
+
+    def test_saving_an_instance_whose_row_was_deleted_inserts_it(self):
+        Invoice.objects.filter(pk=self.invoice.pk).delete()
+        self.invoice.payment_reference = 'REF-1'
+        self.invoice.save()
+        stored = Invoice.objects.get(pk=self.invoice.pk)
+        self.assertEqual((stored.invoice_number, stored.payment_reference), ('INV-ACME', 'REF-1'))
+
+    def test_recompute_does_not_save_a_stale_instance(self):
+        Invoice.objects.filter(pk=self.invoice.pk).update(status='under_review', payment_reference='REF-1')
+        update_invoice_amounts(self.invoice)
+        stored = Invoice.objects.get(pk=self.invoice.pk)
+        self.assertEqual((stored.status, stored.payment_reference, stored.total_amount), ('under_review', 'REF-1', 45000))
+        self.assertEqual((self.invoice.participant_count, self.invoice.total_amount), (3, 45000))
+
+    def test_reconcile_command_repairs_drift(self):
+        Invoice.objects.filter(pk=self.invoice.pk).update(participant_count=42)
+        call_command('reconcile_participant_counts', stdout=mock.Mock())
+        self.assertEqual(self.stored_count(), 3)
+
+
+class AdminInvoiceListTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='staff', password='pass', is_staff=True))
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('admin_invoice_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_keyset_pages_cover_every_invoice_once(self):
+        for i in range(5):
+            make_company(f'company{i}', participant_count=1)
+        Invoice.objects.filter(invoice_number='INV-COMPANY4').update(issue_date=date.today() - timedelta(days=3))
+
+        first = self.get_page(page_size=2)
+        second = self.get_page(page_size=2, after=first['next_cursor'])
+        third = self.get_page(page_size=2, after=second['next_cursor'])
+        numbers = [inv.invoice_number for ctx in (first, second, third) for inv in ctx['invoices']]
+        self.assertEqual(numbers, ['INV-COMPANY3', 'INV-COMPANY2', 'INV-COMPANY1', 'INV-COMPANY0', 'INV-COMPANY4'])
+        self.assertIsNone(third['next_cursor'])
+        self.assertIsNone(first['previous_cursor'])
+
+        back = self.get_page(page_size=2, before=third['previous_cursor'])
+        self.assertEqual([inv.invoice_number for inv in back['invoices']], ['INV-COMPANY1', 'INV-COMPANY0'])
+        self.assertEqual(set(second['admin_forms']), {inv.id for inv in second['invoices']})
+
+    def test_query_count_is_independent_of_table_size(self):
+        make_company('acme')
+        with CaptureQueriesContext(connection) as small:
+            self.get_page(page_size=5)
+        for i in range(20):
+            make_company(f'company{i}', participant_count=1)
+        with CaptureQueriesContext(connection) as large:
+            self.get_page(page_size=5)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='staff', password='pass', is_staff=True))
+        self.acme, self.acme_invoice = make_company('acme')
+        make_company('globex')
+
+    def search(self, url_name, query):
+        response = self.client.get(reverse(url_name), {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def invoice_numbers(self, query):
+        return [invoice.invoice_number for invoice in self.search('admin_invoice_list', query)['invoices']]
+
+    def participant_names(self, query):
+        return sorted(p.name for p in self.search('admin_participants_list', query)['participants'])
+
+    def test_substring_search(self):
+        self.assertEqual(self.invoice_numbers('-ACM'), ['INV-ACME'])
+        self.assertEqual(self.invoice_numbers('globex@exa'), ['INV-GLOBEX'])
+        self.assertEqual(self.participant_names('cme 1'), ['acme 1'])
+        # Queries too short for trigrams fall back to icontains
+        self.assertEqual(self.participant_names('ob'), ['globex 0', 'globex 1'])
+
+    def test_index_follows_changes(self):
+        self.acme.username = 'initech'
+        self.acme.save()
+        self.assertEqual(self.invoice_numbers('initech'), ['INV-ACME'])
+        self.assertEqual(self.invoice_numbers('acme'), ['INV-ACME'])  # still in the invoice number
+
+        bulk_add_participants(self.acme, [Participant(name='Zed Newcomer', email='zed@example.com', phone='0700000000')])
+        self.assertEqual(self.participant_names('newcomer'), ['Zed Newcomer'])
+
+        Participant.objects.filter(name='acme 0').get().delete()
+        self.assertEqual(self.participant_names('acme 0'), [])
+        self.acme_invoice.delete()
+        self.assertEqual(self.invoice_numbers('INV-ACME'), [])
+
+    def test_rebuild_command(self):
+        Invoice.objects.filter(pk=self.acme_invoice.pk).update(invoice_number='INV-RENAMED')
+        call_command('rebuild_search_index', stdout=mock.Mock())
+        self.assertEqual(self.invoice_numbers('renamed'), ['INV-RENAMED'])
+
+
+class QueryIndexTests(TestCase):
+    def test_explain_command_compares_plans(self):
+        make_company('acme')
+        out = StringIO()
+        call_command('explain_query_indexes', repeat=1, stdout=out)
+        report = out.getvalue()
+        self.assertIn('participants_list', report)
+        if connection.vendor == 'sqlite':
+            self.assertIn('USING INDEX participant_user_created_idx', report)
+            # The dropped indexes are restored afterwards
+            self.assertIn('invoice_user_status_date_idx', Invoice.objects.filter(user__username='acme').order_by('status', '-issue_date').explain())
+
+    @override_settings(DEBUG=False)
+    def test_explain_command_refuses_a_live_database(self):
+        make_company('acme')
+        with mock.patch.dict(connection.settings_dict, NAME='apay'):
+            with self.assertRaisesMessage(CommandError, 'Refusing to drop indexes'):
+                call_command('explain_query_indexes', repeat=1, stdout=StringIO())
+        self.assertIn('invoice_user_status_date_idx', Invoice.objects.filter(user__username='acme').order_by('status', '-issue_date').explain())
+
+
+class UserDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user, self.invoice = make_company('acme', participant_count=3)
+        self.client.force_login(self.user)
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        # Deferred entries are callables; they return the built dashboard values
+        return {key: response.context[key]() for key in USER_DASHBOARD_KEYS}, len(ctx.captured_queries)
+
+    def test_stats_are_aggregated(self):
+        Invoice.objects.create(
+            invoice_number='INV-ACME-PAID', user=self.user, due_date=date.today(),
+            status='paid', subtotal=15000, total_amount=15000,
+        )
+        context, _ = self.get_dashboard()
+        self.assertEqual(context['invoice_count'], 2)
+        self.assertEqual(context['unpaid_invoices_count'], 1)
+        self.assertEqual(context['current_amount_due'], 45000)
+        self.assertEqual(context['total_participants'], 3)
+        self.assertEqual(context['latest_unpaid_invoice'], self.invoice)
+
+    def test_query_count_is_independent_of_row_count(self):
+        _, baseline = self.get_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(8):
+                participant = Participant.objects.create(user=self.user, name=f'extra {i}', email=f'x{i}@example.com', phone='1')
+                self.invoice.participants.add(participant)
+        _, queries = self.get_dashboard()
+        self.assertEqual(queries, baseline)
+        self.assertContains(self.client.get(reverse('dashboard')), 'and 6 more participants')
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='pass', is_staff=True)
+        DashboardStats.recompute()
+
+    def assertStatsMatchSource(self):
+        stored = DashboardStats.current()
+        fresh = DashboardStats.recompute()
+        for field in ['total_users', 'total_invoices', 'pending_invoices', 'total_revenue']:
+            self.assertEqual(getattr(stored, field), getattr(fresh, field), field)
+
+    @skipUnless(connection.features.has_select_for_update, 'Row locking needs a database with SELECT ... FOR UPDATE')
+    def test_save_locks_the_row_its_stats_delta_is_taken_from(self):
+        _, invoice = make_company('acme')
+        with CaptureQueriesContext(connection) as ctx:
+            invoice.mark_as_paid('REF-1')
+        self.assertTrue(any('FOR UPDATE' in query['sql'] for query in ctx.captured_queries))
+        self.assertStatsMatchSource()
+
+    def test_signals_and_admin_actions_keep_stats_current(self):
+        from django.contrib.admin.sites import site
+        from .admin import InvoiceAdmin
+
+        _, acme_invoice = make_company('acme')
+        globex, globex_invoice = make_company('globex', participant_count=5)
+        self.assertStatsMatchSource()
+
+        acme_invoice.mark_as_paid('REF-1')
+        self.assertStatsMatchSource()
+
+        InvoiceAdmin(Invoice, site).update_invoices(Invoice.objects.all(), status='paid')
+        self.assertStatsMatchSource()
+        self.assertEqual(DashboardStats.current().pending_invoices, 0)
+
+        bulk_add_participants(globex, [Participant(name='Extra', email='extra@example.com', phone='1')])
+        self.assertStatsMatchSource()
+
+        globex.delete()
+        self.assertStatsMatchSource()
+        self.assertEqual(DashboardStats.current().total_users, 2)
+
+    def test_staff_dashboard_reads_one_row(self):
+        make_company('acme')
+        self.client.force_login(self.staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_invoices'], 1)
+        self.assertEqual(response.context['pending_invoices'], 1)
+        stats_queries = [q for q in ctx.captured_queries if 'dashboardstats' in q['sql']]
+        self.assertEqual(len(stats_queries), 1)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+
+    def test_recompute_command_repairs_drift(self):
+        make_company('acme')
+        DashboardStats.objects.update(total_invoices=99)
+        call_command('recompute_dashboard_stats', stdout=mock.Mock())
+        self.assertEqual(DashboardStats.current().total_invoices, 1)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user, self.invoice = make_company('acme')
+        self.client.force_login(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_repeated_views_skip_fragment_queries(self):
+        for url in [reverse('dashboard'), reverse('invoices_list'), reverse('invoice_detail', args=[self.invoice.id])]:
+            _, first = self.count_queries(url)
+            _, repeated = self.count_queries(url)
+            self.assertLess(repeated, first, url)
+
+    def test_writes_invalidate_the_users_fragments(self):
+        self.client.get(reverse('invoices_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_add_participants(self.user, [Participant(name='Extra', email='extra@example.com', phone='1')])
+        response = self.client.get(reverse('invoices_list'))
+        self.assertContains(response, '<td>3</td>')
+
+    def test_other_users_writes_keep_fragments_cached(self):
+        _, cold = self.count_queries(reverse('dashboard'))
+        with self.captureOnCommitCallbacks(execute=True):
+            make_company('globex')
+        _, warm = self.count_queries(reverse('dashboard'))
+        self.assertLess(warm, cold)
+
+
+class InvoicesListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user, self.invoice = make_company('acme')
+        self.client.force_login(self.user)
+
+    def add_invoice(self, number, status):
+        return Invoice.objects.create(
+            invoice_number=number, user=self.user, due_date=date.today(),
+            status=status, subtotal=15000, total_amount=15000,
+        )
+
+    def get_list(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('invoices_list'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_totals_are_aggregated(self):
+        self.add_invoice('INV-ACME-PAID', 'paid')
+        self.add_invoice('INV-ACME-LATE', 'overdue')
+        response, _ = self.get_list()
+        self.assertEqual(response.context['total_invoices'](), 3)
+        self.assertEqual(response.context['unpaid_invoices_count'](), 2)
+        self.assertEqual(response.context['total_due'](), 45000)
+
+    def test_cached_page_runs_no_invoice_queries(self):
+        self.add_invoice('INV-ACME-PAID', 'paid')
+        response, _ = self.get_list()
+        self.assertContains(response, f'data-invoice-id="{self.invoice.id}"', count=1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('invoices_list'))
+        self.assertFalse([query for query in ctx.captured_queries if 'invoices_invoice' in query['sql']])
+
+    def test_rejected_upload_reopens_the_modal_on_its_invoice(self):
+        response = self.client.post(reverse('invoices_list'), {
+            'upload_proof': '1', 'invoice_id': self.invoice.id, 'payment_method': 'mobile_money',
+            'proof_of_payment': SimpleUploadedFile('receipt.exe', b'MZ'),
+        })
+        self.assertEqual(response.context['proof_invoice'], self.invoice)
+        self.assertContains(response, 'data-show-on-load')
+        self.assertContains(response, 'Unsupported file type.')
+
+    def test_query_count_is_independent_of_invoice_count(self):
+        _, baseline = self.get_list()
+        for i in range(5):
+            self.add_invoice(f'INV-ACME-{i}', 'paid' if i % 2 else 'pending')
+        _, queries = self.get_list()
+        self.assertEqual(queries, baseline)
+
+
+class ResumableProofUploadTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, PROOF_UPLOAD_CHUNK_SIZE=4))
+        self.user, self.invoice = make_company('acme')
+        self.client.force_login(self.user)
+
+    def start(self, invoice, content):
+        response = self.client.post(reverse('start_proof_upload', args=[invoice.id]), {
+            'filename': 'receipt.pdf', 'size': len(content), 'payment_method': 'mobile_money',
+        })
+        self.assertEqual(response.status_code, 201)
+        return reverse('proof_upload', args=[response.json()['id']])
+
+    def send(self, url, chunk, offset):
+        return self.client.generic(
+            'PATCH', url, chunk, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def upload(self, invoice, content):
+        url = self.start(invoice, content)
+        for offset in range(0, len(content), 4):
+            response = self.send(url, content[offset:offset + 4], offset)
+        return response
+
+    def test_upload_resumes_from_stored_offset(self):
+        url = self.start(self.invoice, b'%PDF-receipt')
+        self.assertEqual(self.send(url, b'%PDF', 0).json()['offset'], 4)
+        # A resent chunk is refused with the offset to continue from
+        response = self.send(url, b'%PDF', 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4)
+        self.assertEqual(self.client.get(url).json()['offset'], 4)
+        self.send(url, b'-rec', 4)
+        response = self.send(url, b'eipt', 8).json()
+        self.assertTrue(response['complete'])
+        self.assertIn(self.invoice.invoice_number, response['message'])
+
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, 'under_review')
+        self.assertEqual(self.invoice.payment_method, 'mobile_money')
+        self.assertEqual(self.invoice.proof_of_payment.read(), b'%PDF-receipt')
+        self.assertFalse(ProofUpload.objects.exists())
+
+    def test_identical_uploads_are_stored_once(self):
+        other = Invoice.objects.create(
+            invoice_number='INV-ACME-2', user=self.user, due_date=date.today(), subtotal=0, total_amount=0,
+        )
+        self.upload(self.invoice, b'same bytes')
+        self.upload(other, b'same bytes')
+        self.invoice.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.invoice.proof_of_payment.name, other.proof_of_payment.name)
+        self.assertEqual(default_storage.listdir('invoices/proof_of_payment')[1], [self.invoice.proof_of_payment.name.rsplit('/', 1)[1]])
+
+    def test_oversized_files_and_chunks_are_refused(self):
+        response = self.client.post(reverse('start_proof_upload', args=[self.invoice.id]), {
+            'filename': 'receipt.pdf', 'size': MAX_PROOF_SIZE + 1, 'payment_method': 'cash',
+        })
+        self.assertEqual(response.status_code, 413)
+
+        url = self.start(self.invoice, b'abcdef')
+        response = self.send(url, b'abcd', 0)
+        response = self.send(url, b'efgh', 4)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()['offset'], 4)
+
+    def test_abandoned_uploads_expire_with_their_chunks(self):
+        stale_url = self.start(self.invoice, b'%PDF-receipt')
+        self.send(stale_url, b'%PDF', 0)
+        stale = ProofUpload.objects.get()
+        ProofUpload.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        fresh_url = self.start(self.invoice, b'%PDF-receipt')
+
+        out = StringIO()
+        call_command('expire_proof_uploads', stdout=out)
+        self.assertIn('Removed 1 abandoned upload(s)', out.getvalue())
+        self.assertEqual(self.client.get(stale_url).status_code, 404)
+        self.assertEqual(self.client.get(fresh_url).status_code, 200)
+        self.assertFalse(default_storage.exists(f'invoices/proof_of_payment/partial/{stale.pk}/00000'))
+
+
+@skipUnless(previews.Image is not None, 'Pillow is not installed')
+class ProofPreviewTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user, self.invoice = make_company('acme')
+
+    def attach_proof(self, invoice, name, content):
+        invoice.proof_of_payment.save(name, ContentFile(content))
+
+    def png(self, size=(1200, 900)):
+        output = BytesIO()
+        previews.Image.new('RGB', size, 'red').save(output, 'PNG')
+        return output.getvalue()
+
+    def test_worker_renders_each_proof_once(self):
+        self.attach_proof(self.invoice, 'receipt.png', self.png())
+        _, other = make_company('globex')
+        other.proof_of_payment.name = self.invoice.proof_of_payment.name
+        other.save()
+
+        call_command('generate_proof_previews', once=True, stdout=StringIO())
+        preview = ProofPreview.objects.get(source=self.invoice.proof_of_payment.name)
+        with default_storage.open(preview.preview) as thumbnail:
+            self.assertLessEqual(max(previews.Image.open(thumbnail).size), 300)
+        self.assertEqual(ProofPreview.objects.count(), 1)
+        self.assertEqual(previews.generate_missing_previews(), 0)
+
+    def test_unrenderable_proofs_are_recorded_without_preview(self):
+        self.attach_proof(self.invoice, 'receipt.pdf', b'not really a pdf')
+        previews.generate_missing_previews()
+        self.assertEqual(ProofPreview.objects.get().preview, '')
+        self.assertEqual(previews.generate_missing_previews(), 0)
+
+    def test_admin_pages_show_the_preview_instead_of_the_original(self):
+        staff = User.objects.create_user(username='staff', password='pass', is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+        self.attach_proof(self.invoice, 'receipt.png', self.png())
+        previews.generate_missing_previews()
+        preview_url = default_storage.url(previews.preview_name(self.invoice.proof_of_payment.name))
+
+        for url in [reverse('admin_invoice_list'), reverse('admin:invoices_invoice_change', args=[self.invoice.id])]:
+            response = self.client.get(url)
+            self.assertContains(response, f'src="{preview_url}"')
+            self.assertNotContains(response, f'src="{self.invoice.proof_of_payment.url}"')
+
+
+class InvoiceAdminChangelistTests(TestCase):
+    def setUp(self):
+        staff = User.objects.create_user(username='staff', password='pass', is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:invoices_invoice_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_independent_of_row_count(self):
+        make_company('acme')
+        baseline = self.changelist_queries()
+        for i in range(10):
+            make_company(f'company{i}', participant_count=1)
+        self.assertEqual(self.changelist_queries(), baseline)
+
+    @override_settings(ADMIN_COUNT_CACHE_TIMEOUT=60)
+    def test_cached_count_paginator_reuses_the_count(self):
+        cache.clear()
+        make_company('acme')
+        invoices = Invoice.objects.order_by('id')
+        self.assertEqual(CachedCountPaginator(invoices, 10).count, 1)
+        make_company('globex')
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedCountPaginator(invoices, 10).count, 1)
+
+
+class InvoiceTransitionTests(TestCase):
+    def setUp(self):
+        DashboardStats.recompute()
+        self.staff = User.objects.create_user(username='staff', password='pass', is_staff=True)
+
+    def test_only_allowed_transitions_are_applied_and_audited(self):
+        _, pending = make_company('acme')
+        _, cancelled = make_company('globex', status='cancelled')
+        _, paid = make_company('initech', status='paid')
+
+        moved, skipped = transition_invoices(Invoice.objects.all(), 'paid', changed_by=self.staff, payment_date=date.today())
+        self.assertEqual((moved, skipped), (1, 2))
+        self.assertEqual(Invoice.objects.get(pk=cancelled.pk).status, 'cancelled')
+        pending.refresh_from_db()
+        self.assertEqual((pending.status, pending.payment_date), ('paid', date.today()))
+        change = InvoiceStatusChange.objects.get()
+        self.assertEqual((change.invoice_id, change.from_status, change.to_status, change.changed_by), (pending.pk, 'pending', 'paid', self.staff))
+        self.assertEqual(DashboardStats.current().total_revenue, DashboardStats.recompute().total_revenue)
+
+    def test_query_count_is_independent_of_invoice_count(self):
+        make_company('acme', participant_count=0)
+        with CaptureQueriesContext(connection) as ctx:
+            transition_invoices(Invoice.objects.all(), 'paid')
+        baseline = len(ctx.captured_queries)
+        for i in range(20):
+            make_company(f'company{i}', participant_count=0)
+        with CaptureQueriesContext(connection) as ctx:
+            transition_invoices(Invoice.objects.all(), 'under_review')
+        self.assertEqual(len(ctx.captured_queries), baseline)
+        self.assertEqual(InvoiceStatusChange.objects.filter(to_status='under_review').count(), 21)
+
+
+class OverdueSweepTests(TestCase):
+    def make_invoice(self, user, number, due_date, status='pending'):
+        return Invoice.objects.create(
+            invoice_number=number, user=user, due_date=due_date, status=status, subtotal=15000, total_amount=15000,
+        )
+
+    def test_sweep_moves_past_due_pending_invoices_in_batches(self):
+        DashboardStats.recompute()
+        user = User.objects.create_user(username='acme', password='pass')
+        yesterday = date.today() - timedelta(days=1)
+        late = [self.make_invoice(user, f'INV-LATE-{i}', yesterday) for i in range(5)]
+        current = self.make_invoice(user, 'INV-CURRENT', date.today())
+        under_review = self.make_invoice(user, 'INV-REVIEW', yesterday, status='under_review')
+
+        out = StringIO()
+        call_command('sweep_overdue_invoices', batch_size=2, verbosity=2, stdout=out)
+        self.assertEqual(out.getvalue().count('Moved a batch'), 3)
+        self.assertIn('Moved 5 invoice(s) to overdue', out.getvalue())
+        self.assertEqual(set(Invoice.objects.filter(status='overdue')), set(late))
+        self.assertEqual(Invoice.objects.get(pk=current.pk).status, 'pending')
+        self.assertEqual(Invoice.objects.get(pk=under_review.pk).status, 'under_review')
+        self.assertEqual(InvoiceStatusChange.objects.filter(to_status='overdue').count(), 5)
+        self.assertEqual(DashboardStats.current().pending_invoices, DashboardStats.recompute().pending_invoices)
+
+        # A second run finds nothing left to move
+        self.assertEqual(list(sweep_overdue()), [])
+
+    def test_participants_added_after_a_sweep_join_the_overdue_invoice(self):
+        user, invoice = make_company('acme', participant_count=3)
+        Invoice.objects.filter(pk=invoice.pk).update(due_date=date.today() - timedelta(days=1))
+        list(sweep_overdue())
+
+        added, created = bulk_add_participants(user, [Participant(name='Fourth', email='fourth@example.com', phone='0712345678')])
+        self.assertEqual((added.pk, created), (invoice.pk, False))
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.status, invoice.participant_count, invoice.total_amount), ('overdue', 4, 45000))
+        self.assertTrue(invoice.can_add_participants())
+
+    def test_proof_for_a_swept_invoice_goes_to_review(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, PROOF_UPLOAD_CHUNK_SIZE=1024))
+        user = User.objects.create_user(username='acme', password='pass')
+        yesterday = date.today() - timedelta(days=1)
+        form_upload = self.make_invoice(user, 'INV-FORM', yesterday)
+        chunked_upload = self.make_invoice(user, 'INV-CHUNKED', yesterday)
+        list(sweep_overdue())
+        self.client.force_login(user)
+
+        response = self.client.post(reverse('invoices_list'), {
+            'upload_proof': '1', 'invoice_id': form_upload.id, 'payment_method': 'mobile_money',
+            'proof_of_payment': SimpleUploadedFile('receipt.pdf', b'%PDF-receipt'),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Invoice.objects.get(pk=form_upload.pk).status, 'under_review')
+
+        response = self.client.post(reverse('start_proof_upload', args=[chunked_upload.id]), {
+            'filename': 'receipt.pdf', 'size': 12, 'payment_method': 'mobile_money',
+        })
+        self.client.generic(
+            'PATCH', reverse('proof_upload', args=[response.json()['id']]), b'%PDF-receipt',
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0',
+        )
+        self.assertEqual(Invoice.objects.get(pk=chunked_upload.pk).status, 'under_review')
+
+
+EARLY_BIRD_PRICING = {
+    'apay-summit': [
+        {'min': 1, 'unit_price': 12000, 'ends': date.today().isoformat(), 'notes': 'Early bird x{count}', 'description': 'Early bird'},
+        {'min': 1, 'unit_price': 15000, 'notes': 'Standard x{count}', 'description': 'Standard'},
+    ],
+}
+
+
+class PricingTests(TestCase):
+    def test_default_tiers(self):
+        self.assertEqual([quote(count).total_amount for count in (0, 1, 3, 4, 5, 10)], [0, 15000, 45000, 45000, 55000, 110000])
+        group = quote(4)
+        self.assertEqual(group.notes, 'Payment for 4 participant(s) - Special Group Rate (KES 45,000 total)')
+        self.assertEqual(group.items, [QuoteItem('Group Registration - 4 participants (Special Rate)', 4, Decimal('11250.00'), Decimal(45000))])
+        self.assertEqual(quote(0).notes, 'Add participants to generate invoice')
+
+    @override_settings(INVOICE_PRICING=EARLY_BIRD_PRICING)
+    def test_early_bird_window(self):
+        self.assertEqual(quote(2).total_amount, 24000)
+        self.assertEqual(quote(2, on=date.today() + timedelta(days=1)).total_amount, 30000)
+        self.assertEqual(quote(2).notes, 'Early bird x2')
+
+    def test_overlapping_tiers_prefer_windowed_then_first_listed(self):
+        standard, early_bird = EARLY_BIRD_PRICING['apay-summit'][1], EARLY_BIRD_PRICING['apay-summit'][0]
+        group = {'min': 2, 'unit_price': 12500.1, 'notes': 'Group x{count}', 'description': 'Group'}
+        with override_settings(INVOICE_PRICING={'apay-summit': [standard, group, early_bird]}):
+            self.assertEqual(quote(2).notes, 'Early bird x2')
+            later = date.today() + timedelta(days=1)
+            self.assertEqual([quote(count, on=later).notes for count in (1, 2)], ['Standard x1', 'Standard x2'])
+        with override_settings(INVOICE_PRICING={'apay-summit': [group, standard]}):
+            self.assertEqual(quote(2).items[0].unit_price, Decimal('12500.1'))
+
+    def test_reprice_invoices_in_a_fixed_number_of_queries(self):
+        _, invoice = make_company('acme', participant_count=4)
+        with CaptureQueriesContext(connection) as ctx:
+            changed = reprice_invoices(Invoice.objects.filter(pk=invoice.pk))
+        baseline = len(ctx.captured_queries)
+        self.assertEqual(changed, [invoice])
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.total_amount, invoice.items.get().unit_price), (45000, 11250))
+
+        for i in range(10):
+            make_company(f'company{i}', participant_count=i)
+        with CaptureQueriesContext(connection) as ctx:
+            changed = reprice_invoices(Invoice.objects.all())
+        self.assertEqual(len(ctx.captured_queries), baseline)
+        self.assertEqual(len(changed), 10)
+        self.assertNotIn(invoice, changed)
+        self.assertEqual(Invoice.objects.get(user__username='company7').total_amount, 77000)
+
+    def test_reprice_counts_participants_under_the_lock(self):
+        _, invoice = make_company('acme', participant_count=2)
+        # A stale stored count is not written back; the membership rows decide
+        Invoice.objects.filter(pk=invoice.pk).update(participant_count=7)
+        reprice_invoices([invoice])
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.participant_count, invoice.total_amount), (2, 30000))
+
+
+class RepriceOpenInvoicesTests(TestCase):
+    def setUp(self):
+        _, self.group = make_company('acme', participant_count=4)
+        _, self.drifted = make_company('globex', participant_count=2)
+        # A stored count that fell out of step is taken from the membership rows
+        Invoice.objects.filter(pk=self.drifted.pk).update(participant_count=5)
+        _, self.paid = make_company('initech', participant_count=4, status='paid')
+
+    def test_dry_run_lists_changes_without_writing(self):
+        out = StringIO()
+        call_command('reprice_open_invoices', dry_run=True, batch_size=1, stdout=out)
+        self.assertIn('INV-ACME: 4 -> 4 participant(s), KES 60,000.00 -> 45,000.00', out.getvalue())
+        self.assertIn('INV-GLOBEX: 5 -> 2 participant(s)', out.getvalue())
+        self.assertIn('Would change 2 of 2 open invoice(s)', out.getvalue())
+        self.assertEqual(Invoice.objects.get(pk=self.group.pk).total_amount, 60000)
+        self.assertFalse(self.group.items.exists())
+
+    def test_reprices_open_invoices_only(self):
+        out = StringIO()
+        call_command('reprice_open_invoices', batch_size=1, stdout=out)
+        self.assertIn('Changed 2 of 2 open invoice(s)', out.getvalue())
+        self.group.refresh_from_db()
+        self.assertEqual((self.group.total_amount, self.group.items.get().unit_price), (45000, 11250))
+        self.drifted.refresh_from_db()
+        self.assertEqual((self.drifted.participant_count, self.drifted.total_amount), (2, 30000))
+        self.assertEqual(Invoice.objects.get(pk=self.paid.pk).total_amount, 60000)
+
+        # Nothing is left to change on a second run
+        self.assertEqual([changes for _, changes in reprice_open_invoices()], [[]])
+
+
+class InvoiceItemReconcileTests(TestCase):
+    def setUp(self):
+        self.user, self.invoice = make_company('acme', participant_count=1)
+        update_invoice_amounts(self.invoice)
+        self.events = []
+        invoice_items_changed.connect(self.record, sender=InvoiceItem)
+        self.addCleanup(invoice_items_changed.disconnect, self.record, sender=InvoiceItem)
+
+    def record(self, invoices, created, updated, deleted, **kwargs):
+        self.events.append(([invoice.pk for invoice in invoices], len(created), len(updated), len(deleted)))
+
+    def item_writes(self, queries):
+        return [q['sql'] for q in queries if 'invoiceitem' in q['sql'].lower() and not q['sql'].startswith('SELECT')]
+
+    def test_adding_a_participant_updates_the_item_in_place(self):
+        item = self.invoice.items.get()
+        bulk_add_participants(self.user, [Participant(name='Second', email='second@example.com', phone='0712345678')])
+        updated = self.invoice.items.get()
+        self.assertEqual((updated.pk, updated.quantity, updated.total), (item.pk, 2, 30000))
+        self.assertEqual(self.events, [([self.invoice.pk], 0, 1, 0)])
+
+    def test_unchanged_items_are_not_written(self):
+        with CaptureQueriesContext(connection) as ctx:
+            update_invoice_amounts(self.invoice)
+            reprice_invoices(Invoice.objects.all())
+        self.assertEqual(self.item_writes(ctx.captured_queries), [])
+        self.assertEqual(self.events, [])
+
+    def test_surplus_items_are_deleted(self):
+        InvoiceItem.objects.create(invoice=self.invoice, description='Extra', quantity=1, unit_price=500)
+        self.invoice.participants.clear()
+        reprice_invoices(Invoice.objects.all())
+        self.assertFalse(self.invoice.items.exists())
+        self.assertEqual(self.events, [([self.invoice.pk], 0, 0, 2)])
+
+
+def async_urlconf():
+    """The project URLs with the read-heavy pages served by invoices.async_views"""
+    from django.contrib import admin
+    from django.urls import include, path
+    from . import urls as invoice_urls
+    patterns = [
+        path(str(pattern.pattern), getattr(async_views, pattern.name), name=pattern.name)
+        if pattern.name in ASYNC_PAGES else pattern
+        for pattern in invoice_urls.urlpatterns
+    ]
+    # A class rather than a namespace object, since URL resolvers are cached by urlconf
+    return type('AsyncURLConf', (), {'urlpatterns': [path('admin/', admin.site.urls), path('invoices/', include(patterns))]})
+
+
+ASYNC_PAGES = ['dashboard', 'invoices_list', 'invoice_detail', 'participants_list']
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user, self.invoice = make_company('acme', participant_count=3)
+        self.enterContext(override_settings(ROOT_URLCONF=async_urlconf()))
+        self.async_client = AsyncClient()
+
+    def pages(self):
+        """(url, text the page must show)"""
+        return [
+            (reverse('dashboard'), 'acme 0'),
+            (reverse('invoices_list'), self.invoice.invoice_number),
+            (reverse('invoice_detail', args=[self.invoice.id]), 'acme 2'),
+            (reverse('participants_list'), 'acme 1'),
+        ]
+
+    async def test_async_pages_render_the_users_data(self):
+        await self.async_client.aforce_login(self.user)
+        for url, text in self.pages():
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertContains(response, text)
+
+    def test_cached_pages_skip_the_data_queries(self):
+        # Sync so the query capture can touch the connection; the views still run on the event loop
+        self.async_client.force_login(self.user)
+        get = async_to_sync(self.async_client.get)
+        for url, _ in self.pages()[:3]:
+            with CaptureQueriesContext(connection) as cold:
+                get(url)
+            with CaptureQueriesContext(connection) as warm:
+                get(url)
+            self.assertLess(len(warm), len(cold), url)
+
+    async def test_summary_rendered_after_a_cache_check_still_has_totals(self):
+        await self.async_client.aforce_login(self.user)
+        # The fragments looked current when checked but are gone by render time
+        with mock.patch.object(async_views, 'afragments_cached', mock.AsyncMock(return_value=True)):
+            response = await self.async_client.get(reverse('invoices_list'))
+        self.assertContains(response, '<h2 class="card-text">1</h2>', count=2)
+
+    def test_async_views_setting_routes_the_pages(self):
+        from . import urls
+        self.addCleanup(importlib.reload, urls)
+        with override_settings(ASYNC_VIEWS=True):
+            importlib.reload(urls)
+        callbacks = {pattern.name: pattern.callback for pattern in urls.urlpatterns}
+        for name in ASYNC_PAGES:
+            self.assertIs(callbacks[name], getattr(async_views, name), name)
+        self.assertIs(callbacks['add_participant'], views.add_participant)
+
+    async def test_dashboard_builders_agree(self):
+        self.assertEqual(await abuild_user_dashboard(self.user), await sync_to_async(build_user_dashboard)(self.user))
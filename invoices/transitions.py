@@ -0,0 +1,75 @@
+"""
+Bulk invoice status transitions. Each call locks the selected invoices,
+drops the ones whose current status cannot move to the target, applies the
+rest in a single UPDATE, writes their InvoiceStatusChange rows with one
+bulk_create and sends invoices_transitioned once, whose receiver keeps the
+dashboard stats, cached PDFs and cached fragments current.
+
+sweep_overdue() moves past-due pending invoices to overdue in batches.
+"""
+from datetime import date
+from django.db import transaction
+from django.utils import timezone
+from .models import Invoice, InvoiceStatusChange, invoices_transitioned
+
+ALLOWED_TRANSITIONS = {
+    'pending': {'under_review', 'paid', 'overdue', 'cancelled'},
+    'overdue': {'pending', 'under_review', 'paid', 'cancelled'},
+    'under_review': {'pending', 'paid', 'overdue'},
+    # Reversals after a bounced payment or a wrongly confirmed proof
+    'paid': {'pending', 'under_review'},
+    'cancelled': {'pending'},
+}
+
+
+def can_transition(from_status, to_status):
+    return to_status in ALLOWED_TRANSITIONS.get(from_status, ())
+
+
+def transition_invoices(invoices, status, changed_by=None, **fields):
+    """
+    Move the invoices to status, setting fields on the ones that move.
+    Returns (moved, skipped); invoices already in status or not allowed
+    to reach it are skipped and left untouched.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            Invoice.objects.select_for_update()
+            .filter(pk__in=invoices.values('pk'))
+            .values_list('id', 'user_id', 'status', 'total_amount')
+        )
+        moving = [row for row in rows if can_transition(row[2], status)]
+        if moving:
+            Invoice.objects.filter(pk__in=[row[0] for row in moving]).update(status=status, updated_at=now, **fields)
+            InvoiceStatusChange.objects.bulk_create([
+                InvoiceStatusChange(
+                    invoice_id=invoice_id, from_status=from_status, to_status=status,
+                    changed_by=changed_by, changed_at=now,
+                )
+                for invoice_id, _, from_status, _ in moving
+            ])
+            invoices_transitioned.send(sender=Invoice, rows=moving, status=status)
+    return len(moving), len(rows) - len(moving)
+
+
+def sweep_overdue(batch_size=500, today=None):
+    """
+    Move pending invoices due before today to overdue, one committed batch
+    at a time, yielding the size of each batch. Rows another sweeper has
+    locked are skipped, so sweepers can run side by side, and a sweep that
+    stops part way simply leaves the rest pending for the next run.
+    """
+    today = today or date.today()
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Invoice.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', due_date__lt=today)
+                .order_by('due_date', 'id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not batch:
+                return
+            moved, _ = transition_invoices(Invoice.objects.filter(pk__in=batch), 'overdue')
+        yield moved
@@ -0,0 +1,189 @@
+"""
+Resumable proof of payment uploads. The client announces the file, then
+sends it in chunks at increasing offsets; each chunk is streamed into the
+default storage as it is read from the request, so an interrupted upload
+resumes from the last stored chunk. Completed files are stored once per
+content hash as ``invoices/proof_of_payment/<sha256><ext>``, which stays
+within the 100 characters of Invoice.proof_of_payment. Uploads that receive
+no chunk for PROOF_UPLOAD_EXPIRY seconds are removed by expire_uploads().
+"""
+import hashlib
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from .models import Invoice, ProofUpload
+
+PROOF_EXTENSIONS = ['.pdf', '.jpg', '.jpeg', '.png', '.gif']
+MAX_PROOF_SIZE = 5 * 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A rejected upload request; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_chunk_size():
+    return getattr(settings, 'PROOF_UPLOAD_CHUNK_SIZE', 512 * 1024)
+
+
+def upload_expiry():
+    return getattr(settings, 'PROOF_UPLOAD_EXPIRY', 60 * 60 * 24)
+
+
+def chunk_name(upload, index):
+    return f'invoices/proof_of_payment/partial/{upload.pk}/{index:05d}'
+
+
+def content_name(digest, filename):
+    return f'invoices/proof_of_payment/{digest}{os.path.splitext(filename)[1].lower()}'
+
+
+class LimitedReader:
+    """Read at most limit bytes from stream, failing as soon as more arrive"""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.remaining = limit
+        self.size = 0
+
+    def read(self, size=READ_SIZE):
+        # Ask for one byte past the allowance so an oversized body is caught mid-stream
+        data = self.stream.read(min(size, self.remaining + 1))
+        self.remaining -= len(data)
+        if self.remaining < 0:
+            raise UploadError('Chunk is larger than the rest of the announced file.', status=413)
+        self.size += len(data)
+        return data
+
+
+def start_upload(invoice, filename, size, payment_method, payment_notes=''):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in PROOF_EXTENSIONS:
+        raise UploadError('Unsupported file type. Please upload PDF or image files (PDF, JPG, PNG, GIF).')
+    if not 0 < size <= MAX_PROOF_SIZE:
+        raise UploadError('File size must be less than 5MB.', status=413)
+    if payment_method not in dict(Invoice._meta.get_field('payment_method').choices):
+        raise UploadError('Select a valid payment method.')
+    if invoice.status in ['paid', 'cancelled']:
+        raise UploadError('This invoice no longer accepts proof of payment.', status=409)
+    return ProofUpload.objects.create(
+        invoice=invoice, filename=os.path.basename(filename), size=size,
+        payment_method=payment_method, payment_notes=payment_notes,
+    )
+
+
+def append_chunk(upload_id, stream, offset):
+    """
+    Store the chunk read from stream at offset and return the locked upload.
+    The offset must equal the bytes already received, so a chunk resent
+    after a dropped response is answered with the current offset instead.
+    """
+    with transaction.atomic():
+        upload = ProofUpload.objects.select_for_update().get(pk=upload_id)
+        if offset != upload.received:
+            raise UploadError(f'Expected offset {upload.received}.', status=409)
+        reader = LimitedReader(stream, min(upload.size - upload.received, max_chunk_size()))
+        name = chunk_name(upload, upload.chunk_count)
+        # Drop what an interrupted attempt at this chunk left behind
+        default_storage.delete(name)
+        try:
+            default_storage.save(name, File(reader))
+            if not reader.size:
+                raise UploadError('Empty chunk.')
+        except Exception:
+            default_storage.delete(name)
+            raise
+        upload.received += reader.size
+        upload.chunk_count += 1
+        upload.save(update_fields=['received', 'chunk_count', 'updated_at'])
+        if upload.is_complete():
+            finish_upload(upload)
+    return upload
+
+
+def iter_chunks(upload):
+    for index in range(upload.chunk_count):
+        with default_storage.open(chunk_name(upload, index)) as chunk:
+            yield from iter(lambda: chunk.read(READ_SIZE), b'')
+
+
+class ChunkStream:
+    """File-like view over the stored chunks, read front to back once"""
+
+    def __init__(self, upload):
+        self.blocks = iter_chunks(upload)
+        self.buffer = b''
+
+    def read(self, size=READ_SIZE):
+        while len(self.buffer) < size:
+            block = next(self.blocks, None)
+            if block is None:
+                break
+            self.buffer += block
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def content_digest(upload):
+    sha256 = hashlib.sha256()
+    for block in iter_chunks(upload):
+        sha256.update(block)
+    return sha256.hexdigest()
+
+
+def finish_upload(upload):
+    """Store the assembled file once per content hash and attach it to the invoice"""
+    # hashlib state cannot outlive a request, so hash the stored chunks in one pass
+    name = content_name(content_digest(upload), upload.filename)
+    if not default_storage.exists(name):
+        stored = default_storage.save(name, File(ChunkStream(upload)))
+        if stored != name:
+            # A concurrent upload of the same content won the race; keep one copy
+            default_storage.delete(stored)
+    invoice = upload.invoice
+    invoice.proof_of_payment.name = name
+    invoice.payment_method = upload.payment_method
+    invoice.payment_notes = upload.payment_notes
+    # save() moves a pending or overdue invoice to under_review
+    invoice.save()
+    discard_upload(upload)
+    return invoice
+
+
+def discard_upload(upload):
+    for index in range(upload.chunk_count):
+        default_storage.delete(chunk_name(upload, index))
+    upload.delete()
+
+
+def expire_uploads():
+    """Discard the uploads left without a new chunk for upload_expiry() seconds; return how many"""
+    cutoff = timezone.now() - timedelta(seconds=upload_expiry())
+    stale = list(ProofUpload.objects.filter(updated_at__lt=cutoff).values_list('pk', flat=True))
+    expired = 0
+    for upload_id in stale:
+        with transaction.atomic():
+            # An upload a client is appending to right now is locked, and skipped
+            upload = ProofUpload.objects.select_for_update(skip_locked=True).filter(pk=upload_id, updated_at__lt=cutoff).first()
+            if upload is not None:
+                discard_upload(upload)
+                expired += 1
+    return expired
+
+
+def upload_state(upload):
+    return {
+        'id': str(upload.id),
+        'offset': upload.received,
+        'size': upload.size,
+        'chunk_size': max_chunk_size(),
+        'complete': upload.is_complete(),
+    }
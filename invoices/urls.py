@@ -1,7 +1,12 @@
 from django.urls import path
 from . import views
+from django.conf import settings
 from django.contrib.auth import views as auth_views
 from django.urls import path, reverse_lazy
+from . import async_views
+
+# Under ASGI the read-heavy pages are served by their native async versions
+pages = async_views if getattr(settings, 'ASYNC_VIEWS', False) else views
 
 
 urlpatterns = [
@@ -10,12 +15,14 @@ urlpatterns = [
     path('logout/', views.user_logout, name='logout'),
     path('verify-email/<str:token>/', views.verify_email, name='verify_email'),
     path('resend-verification/', views.resend_verification, name='resend_verification'),
-    path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/', pages.dashboard, name='dashboard'),
     path('add-participant/', views.add_participant, name='add_participant'),
-    path('participants/', views.participants_list, name='participants_list'),
-    path('invoices/', views.invoices_list, name='invoices_list'),
-    path('invoice/<int:invoice_id>/', views.invoice_detail, name='invoice_detail'),
+    path('participants/', pages.participants_list, name='participants_list'),
+    path('invoices/', pages.invoices_list, name='invoices_list'),
+    path('invoice/<int:invoice_id>/', pages.invoice_detail, name='invoice_detail'),
     path('invoice/<int:invoice_id>/download/', views.download_invoice_pdf, name='download_invoice'),
+    path('invoice/<int:invoice_id>/proof-uploads/', views.start_proof_upload, name='start_proof_upload'),
+    path('proof-uploads/<uuid:upload_id>/', views.proof_upload, name='proof_upload'),
 
     # Help manual URLs
     path('help/', views.help_manual, name='help_manual'),
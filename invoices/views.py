@@ -1,20 +1,32 @@
 from django.contrib.auth.models import User
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods, require_POST
 from django.template.loader import render_to_string
-from io import BytesIO
-from xhtml2pdf import pisa
 import uuid
+from decimal import Decimal
 from datetime import date, timedelta
 from django.contrib import messages
-from .forms import UserRegistrationForm, ParticipantForm, MultipleParticipantForm, AdminPaymentForm, EmailAuthenticationForm
-from .models import Invoice, InvoiceItem, Participant, UserProfile
-from django.db import models
+from .forms import UserRegistrationForm, ParticipantForm, MultipleParticipantForm, ParticipantFileImportForm, AdminPaymentForm, EmailAuthenticationForm
+from .models import UNPAID_STATUSES, DashboardStats, Invoice, Participant, ProofUpload, UserProfile
+from .dashboard import USER_DASHBOARD_KEYS, build_user_dashboard
+from .fragments import deferred, fragment_context
+from .reports import build_user_summary, with_invoice_list, participants_csv_rows
+from .imports import ImportFileError, batched, iter_participant_rows
+from .outbox import queue_email
+from .uploads import UploadError, append_chunk, start_upload, upload_state
+from .pagination import keyset_paginate
+from .search import index_participants, search_invoices, search_participants
+from .previews import with_proof_preview
+from .pdf import PdfRenderUnavailable, aget_invoice_pdf, invoice_pdf_queryset, pdf_renderer
+from .pricing import PRICED_FIELDS, apply_quote, quote, quote_invoice, reconcile_items
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
 from django.conf import settings
-from django.core.mail import send_mail
 from django.utils import timezone
 from django.contrib import messages
 from .forms import ProofOfPaymentForm, AdminPaymentVerificationForm
@@ -42,7 +54,7 @@ def register(request):
     return render(request, 'invoices/register.html', {'form': form})
 
 def send_verification_email(user, verification_token):
-    """Send verification email to user"""
+    """Queue verification email to user"""
     verification_url = f"{settings.SITE_URL}/invoices/verify-email/{verification_token}/"
     
     subject = 'Verify Your Email - Apay Summit Registration'
@@ -68,14 +80,7 @@ def send_verification_email(user, verification_token):
         'verification_url': verification_url,
     })
     
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-        fail_silently=False,
-        html_message=html_message,
-    )
+    queue_email(subject, message, user.email, html_body=html_message)
 
 def verify_email(request, token):
     """Verify user's email address"""
@@ -166,10 +171,7 @@ def user_login(request):
     return render(request, 'invoices/login.html')
 
 def send_welcome_email(user):
-    """Send welcome email to new user"""
-    from django.core.mail import send_mail
-    from django.conf import settings
-    
+    """Queue welcome email to new user"""
     subject = 'Welcome to Apay Summit Registration System'
     message = f'''
     Hello {user.username},
@@ -189,13 +191,7 @@ def send_welcome_email(user):
     Apay Summit Team
     '''
     
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-        fail_silently=False,
-    )
+    queue_email(subject, message, user.email)
 
 # Allow login with both username and email
 def user_login_universal(request):
@@ -236,43 +232,18 @@ def user_logout(request):
 @login_required
 def dashboard(request):
     if request.user.is_staff:
-        # Admin dashboard with system stats
-        from django.contrib.auth.models import User
-        from django.db.models import Sum
-        
-        total_users = User.objects.count()
-        total_invoices = Invoice.objects.count()
-        pending_invoices = Invoice.objects.filter(status__in=['pending', 'overdue']).count()
-        total_revenue = Invoice.objects.filter(status='paid').aggregate(
-            total=Sum('total_amount')
-        )['total'] or 0
-        
+        # Admin dashboard reads the precomputed stats row
+        stats = DashboardStats.current()
         context = {
-            'total_users': total_users,
-            'total_invoices': total_invoices,
-            'pending_invoices': pending_invoices,
-            'total_revenue': total_revenue,
+            'total_users': stats.total_users,
+            'total_invoices': stats.total_invoices,
+            'pending_invoices': stats.pending_invoices,
+            'total_revenue': stats.total_revenue,
         }
     else:
-        # Normal user dashboard (existing code)
-        invoices = Invoice.objects.filter(user=request.user).order_by('status', '-issue_date')
-        participants = Participant.objects.filter(user=request.user)
-        
-        total_participants = participants.count()
-        latest_unpaid_invoice = invoices.filter(status__in=['pending', 'overdue']).first()
-        latest_invoice = invoices.first()
-        unpaid_invoices = invoices.filter(status__in=['pending', 'overdue'])
-        current_amount_due = sum(invoice.total_amount for invoice in unpaid_invoices)
-        
-        context = {
-            'invoices': invoices,
-            'participants': participants,
-            'total_participants': total_participants,
-            'latest_invoice': latest_invoice,
-            'latest_unpaid_invoice': latest_unpaid_invoice,
-            'current_amount_due': current_amount_due,
-            'unpaid_invoices_count': unpaid_invoices.count(),
-        }
+        # Only queried when the cached dashboard fragment is stale
+        context = deferred(lambda: build_user_dashboard(request.user), USER_DASHBOARD_KEYS)
+    context.update(fragment_context(request.user.pk))
     
     return render(request, 'invoices/dashboard.html', context)
 
@@ -280,35 +251,20 @@ def dashboard(request):
 def add_participant(request):
     single_form = ParticipantForm()
     multiple_form = MultipleParticipantForm()
+    file_form = ParticipantFileImportForm()
+    import_errors = []
     
     if request.method == 'POST':
         if 'single_submit' in request.POST:
             single_form = ParticipantForm(request.POST)
             if single_form.is_valid():
                 participant = single_form.save(commit=False)
-                participant.user = request.user
-                participant.save()
-                
-                # Get existing invoices for this user
-                existing_invoices = Invoice.objects.filter(user=request.user)
-                
-                # Check if there's an unpaid invoice we can add to
-                unpaid_invoice = existing_invoices.filter(status='pending').first()
+                invoice, created = bulk_add_participants(request.user, [participant])
                 
-                if unpaid_invoice:
-                    # Add participant to existing unpaid invoice
-                    unpaid_invoice.participants.add(participant)
-                    # Update invoice amounts
-                    update_invoice_amounts(unpaid_invoice)
-                    messages.success(request, 'Participant added successfully! Existing invoice updated.')
-                else:
-                    # Create new invoice for this user
-                    invoice = create_invoice(request.user)
-                    # Add participant to invoice
-                    invoice.participants.add(participant)
-                    # Update invoice amounts
-                    update_invoice_amounts(invoice)
+                if created:
                     messages.success(request, 'Participant added successfully! New invoice generated.')
+                else:
+                    messages.success(request, 'Participant added successfully! Existing invoice updated.')
                 
                 return redirect('dashboard')
                 
@@ -316,41 +272,17 @@ def add_participant(request):
             multiple_form = MultipleParticipantForm(request.POST)
             if multiple_form.is_valid():
                 participants_data = multiple_form.cleaned_data['participants_data']
-                lines = participants_data.strip().split('\n')
-                added_count = 0
-                errors = []
-                
-                # Get existing invoices for this user
-                existing_invoices = Invoice.objects.filter(user=request.user)
-                unpaid_invoice = existing_invoices.filter(status='pending').first()
-                
-                # If no unpaid invoice exists, create one
-                if not unpaid_invoice:
-                    unpaid_invoice = create_invoice(request.user)
+                rows = [
+                    (i, [part.strip() for part in parts])
+                    for i, parts in enumerate(csv.reader(participants_data.strip().splitlines()), 1)
+                    if any(parts)
+                ]
                 
-                for i, line in enumerate(lines, 1):
-                    line = line.strip()
-                    if line:
-                        parts = [part.strip() for part in line.split(',')]
-                        if len(parts) == 3:
-                            name, email, phone = parts
-                            if name and email:  # Basic validation
-                                participant = Participant(
-                                    user=request.user,
-                                    name=name,
-                                    email=email,
-                                    phone=phone
-                                )
-                                participant.save()
-                                unpaid_invoice.participants.add(participant)
-                                added_count += 1
-                            else:
-                                errors.append(f"Line {i}: Name and email are required")
-                        else:
-                            errors.append(f"Line {i}: Invalid format. Expected: Name,Email,Phone")
-                
-                # Update invoice amounts
-                update_invoice_amounts(unpaid_invoice)
+                # Validate every line before touching the database
+                participants, errors = validate_participant_rows(rows)
+                if participants:
+                    bulk_add_participants(request.user, participants)
+                added_count = len(participants)
                 
                 if added_count > 0:
                     messages.success(request, f'Successfully added {added_count} participants! Invoice updated.')
@@ -359,64 +291,53 @@ def add_participant(request):
                         messages.warning(request, error)
                 
                 return redirect('dashboard')
+        
+        elif 'file_submit' in request.POST:
+            file_form = ParticipantFileImportForm(request.POST, request.FILES)
+            if file_form.is_valid():
+                rows = iter_participant_rows(file_form.cleaned_data['participants_file'])
+                try:
+                    added_count, import_errors = import_participant_rows(request.user, rows)
+                except ImportFileError as exc:
+                    file_form.add_error('participants_file', f'Nothing was imported. {exc}')
+                else:
+                    if added_count > 0:
+                        messages.success(request, f'Successfully imported {added_count} participants! Invoice updated.')
+                    if not import_errors:
+                        return redirect('dashboard')
     
     context = {
         'single_form': single_form,
         'multiple_form': multiple_form,
+        'file_form': file_form,
+        'import_errors': import_errors,
     }
     return render(request, 'invoices/add_participant.html', context)
 
-def format_currency(value):
-    """Format currency with commas for PDF"""
-    try:
-        return "{:,.2f}".format(float(value))
-    except (ValueError, TypeError):
-        return str(value)
-
 def custom_404(request, exception):
     return render(request, 'invoices/404.html', status=404)
 
-def format_currency(value):
-    """Format currency with commas for PDF"""
-    try:
-        return "{:,.2f}".format(float(value))
-    except (ValueError, TypeError):
-        return str(value)
-    
+def pdf_unavailable_response():
+    response = HttpResponse('PDF generation is busy right now. Please retry in a moment.', status=503)
+    response['Retry-After'] = '10'
+    return response
+
 @login_required
-def download_invoice_pdf(request, invoice_id):
+async def download_invoice_pdf(request, invoice_id):
     # Allow staff users to download any invoice, regular users only their own
-    if request.user.is_staff:
-        invoice = get_object_or_404(Invoice, id=invoice_id)
+    user = await request.auser()
+    if user.is_staff:
+        invoice = await aget_object_or_404(invoice_pdf_queryset(), id=invoice_id)
     else:
-        invoice = get_object_or_404(Invoice, id=invoice_id, user=request.user)
-    
-    # Format currency amounts for PDF WITHOUT overwriting originals
-    # Add formatted versions as new attributes
-    invoice.subtotal_formatted = format_currency(invoice.subtotal)
-    invoice.tax_amount_formatted = format_currency(invoice.tax_amount)
-    invoice.total_amount_formatted = format_currency(invoice.total_amount)
-
-    # Format items without overwriting originals
-    for item in invoice.items.all():
-        item.unit_price_formatted = format_currency(item.unit_price)
-        item.total_formatted = format_currency(item.total)
+        invoice = await aget_object_or_404(invoice_pdf_queryset(), id=invoice_id, user=user)
     
-    # Logo URL    
-    logo_url = "https://icta.go.ke//assets/images/ictalogo.png"  
-
-    # Render HTML template with logo URL
-    html_string = render_to_string('invoices/invoice_pdf.html', {
-        'invoice': invoice,
-        'logo_url': logo_url
-    })
+    try:
+        pdf = await aget_invoice_pdf(invoice)
+    except PdfRenderUnavailable:
+        return pdf_unavailable_response()
     
-    # Create PDF using xhtml2pdf
-    result = BytesIO()
-    pdf = pisa.pisaDocument(BytesIO(html_string.encode("UTF-8")), result)
-
-    if not pdf.err:
-        response = HttpResponse(result.getvalue(), content_type='application/pdf')
+    if pdf is not None:
+        response = HttpResponse(pdf, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.invoice_number}.pdf"'
         return response
     
@@ -424,12 +345,7 @@ def download_invoice_pdf(request, invoice_id):
 
 def calculate_pricing(participant_count):
     """Calculate pricing based on participant count"""
-    if participant_count <= 3:
-        return 15000 * participant_count
-    elif participant_count == 4:
-        return 45000
-    else:  # More than 4
-        return 11000 * participant_count
+    return quote(participant_count).subtotal
 
 def get_or_create_invoice(user):
     """Get existing invoice or create new one for user"""
@@ -459,65 +375,87 @@ def create_invoice(user):
     
     return invoice
 
+def validate_participant_rows(rows):
+    """Validate (line number, [name, email, phone]) rows with the ParticipantForm rules"""
+    participants = []
+    errors = []
+    for line_number, parts in rows:
+        if len(parts) != 3:
+            errors.append(f"Line {line_number}: Invalid format. Expected: Name,Email,Phone")
+            continue
+        form = ParticipantForm(dict(zip(['name', 'email', 'phone'], parts)))
+        if form.is_valid():
+            participants.append(form.save(commit=False))
+        else:
+            problems = "; ".join(f"{field}: {' '.join(field_errors)}" for field, field_errors in form.errors.items())
+            errors.append(f"Line {line_number}: {problems}")
+    return participants, errors
+
+def pending_invoice_for_update(user):
+    """Lock the user's invoices and return (latest unpaid invoice, created); call inside a transaction"""
+    # Locking the user row serialises concurrent adds for the same company, so
+    # two requests cannot both miss the unpaid invoice and create one each
+    User.objects.select_for_update().get(pk=user.pk)
+    # An overdue invoice keeps taking participants, so a group swept past its
+    # due date stays on one invoice and keeps its group rate
+    invoice = Invoice.objects.filter(user=user, status__in=UNPAID_STATUSES).order_by('-issue_date', '-id').first()
+    if invoice:
+        return invoice, False
+    return create_invoice(user), True
+
+def bulk_add_participants(user, participants):
+    """Insert participants and attach them to the user's latest unpaid invoice; return (invoice, created)"""
+    Membership = Invoice.participants.through
+    with transaction.atomic():
+        invoice, created = pending_invoice_for_update(user)
+        for participant in participants:
+            participant.user = user
+        Participant.objects.bulk_create(participants)
+        Membership.objects.bulk_create([
+            Membership(invoice=invoice, participant=participant) for participant in participants
+        ])
+        # bulk_create skips post_save, so index the new rows here
+        index_participants(participants)
+        update_invoice_amounts(invoice)
+    return invoice, created
+
+def import_participant_rows(user, rows):
+    """Validate and insert uploaded rows batch by batch; return (added count, errors)"""
+    batch_size = getattr(settings, 'PARTICIPANT_IMPORT_BATCH_SIZE', 500)
+    added_count = 0
+    errors = []
+    with transaction.atomic():
+        for batch in batched(rows, batch_size):
+            participants, batch_errors = validate_participant_rows(batch)
+            errors.extend(batch_errors)
+            if participants:
+                bulk_add_participants(user, participants)
+                added_count += len(participants)
+    return added_count, errors
+
 def update_invoice_amounts(invoice):
     """Update invoice amounts based on participants"""
-    participant_count = invoice.participants.count()
-    
-    if participant_count == 0:
-        # No participants, set amounts to zero
-        invoice.subtotal = 0.00
-        invoice.tax_amount = 0.00
-        invoice.total_amount = 0.00
-        invoice.notes = "Add participants to generate invoice"
-    else:
-        # Calculate amounts based on participants
-        subtotal = calculate_pricing(participant_count)
-        tax_amount = 0.00  # VAT is exclusive
-        total_amount = subtotal + tax_amount
-        
-        invoice.subtotal = subtotal
-        invoice.tax_amount = tax_amount
-        invoice.total_amount = total_amount
-        
-        # Update notes based on pricing structure
-        if participant_count <= 3:
-            invoice.notes = f"Payment for {participant_count} participant(s) - Individual Rate (KES 15,000 per person)"
-        elif participant_count == 4:
-            invoice.notes = f"Payment for {participant_count} participant(s) - Special Group Rate (KES 45,000 total)"
-        else:
-            invoice.notes = f"Payment for {participant_count} participant(s) - Group Rate (KES 11,000 per person)"
-    
-    invoice.save()
+    with transaction.atomic():
+        # Recompute on the row as read under its lock, so neither concurrent
+        # recomputes nor a stale caller instance can save old values
+        locked = Invoice.objects.select_for_update().get(pk=invoice.pk)
+        set_invoice_amounts(locked, locked.participants.count())
+    for field in PRICED_FIELDS:
+        setattr(invoice, field, getattr(locked, field))
+
+def set_invoice_amounts(invoice, participant_count):
+    """Save invoice amounts, notes and items for a known participant count"""
+    invoice.participant_count = participant_count
+    invoice_quote = quote_invoice(invoice)
+    apply_quote(invoice, invoice_quote)
+    invoice.save(update_fields=PRICED_FIELDS)
     
     # Update or create invoice items
-    update_invoice_items(invoice, participant_count)
-
-def update_invoice_items(invoice, participant_count):
-    """Update invoice items based on participant count and pricing"""
-    # Clear existing items
-    invoice.items.all().delete()
-    
-    if participant_count == 0:
-        return
-    
-    # Add main registration item
-    if participant_count <= 3:
-        description = f"Individual Registration - {participant_count} participant(s)"
-        unit_price = 15000
-    elif participant_count == 4:
-        description = "Group Registration - 4 participants (Special Rate)"
-        unit_price = 11250  # 45000 / 4
-    else:
-        description = f"Group Registration - {participant_count} participant(s)"
-        unit_price = 11000
-    
-    InvoiceItem.objects.create(
-        invoice=invoice,
-        description=description,
-        quantity=participant_count,
-        unit_price=unit_price,
-        total=invoice.subtotal
-    )
+    update_invoice_items(invoice, invoice_quote.items)
+
+def update_invoice_items(invoice, items):
+    """Bring the invoice items in line with the quoted line items, writing only the ones that differ"""
+    reconcile_items({invoice: items})
 
 @login_required
 def participants_list(request):
@@ -572,24 +510,34 @@ def invoice_detail(request, invoice_id):
     
     context = {
         'invoice': invoice,
+        # Lazy; only evaluated when the cached invoice fragments are stale
+        'items': invoice.items.all(),
+        'participants': invoice.participants.all(),
         'can_add_participants': can_add_participants,
         'proof_form': proof_form,
+        **fragment_context(invoice.user_id),
     }
     return render(request, 'invoices/invoice.html', context)
 
+INVOICE_TOTALS_KEYS = ['total_invoices', 'unpaid_invoices_count', 'total_due']
+
+def invoice_totals():
+    """Aggregates behind the invoices_list summary, for one user's invoices"""
+    unpaid = Q(status__in=UNPAID_STATUSES)
+    return {
+        'total_invoices': Count('id'),
+        'unpaid_invoices_count': Count('id', filter=unpaid),
+        'total_due': Coalesce(Sum('total_amount', filter=unpaid), Decimal(0)),
+    }
+
 @login_required
 def invoices_list(request):
+    # Evaluated once by the cached table fragment, and only when it is stale
     invoices = Invoice.objects.filter(user=request.user).order_by('-issue_date')
     
-    # Calculate totals
-    total_invoices = invoices.count()
-    unpaid_invoices = invoices.filter(status__in=['pending', 'overdue'])
-    total_due = sum(invoice.total_amount for invoice in unpaid_invoices)
-    
-    # Create forms for each invoice
-    invoice_forms = {}
-    for invoice in invoices:
-        invoice_forms[invoice.id] = ProofOfPaymentForm(instance=invoice)
+    # The upload modal is shared by the Pay buttons, which fill it in, so
+    # nothing is loaded for it unless an upload fails validation
+    proof_form, proof_invoice = ProofOfPaymentForm(), None
     
     if request.method == 'POST' and 'upload_proof' in request.POST:
         invoice_id = request.POST.get('invoice_id')
@@ -601,21 +549,66 @@ def invoices_list(request):
             return redirect('invoices_list')
         else:
             messages.error(request, 'Please correct the errors below.')
-            # Update the form for this specific invoice
-            invoice_forms[invoice.id] = proof_form
+            # Reopen the modal on this invoice with the errors
+            proof_invoice = invoice
+    
+    # Totals are aggregated in one query, only when the cached summary fragment is stale
+    totals = deferred(lambda: invoices.aggregate(**invoice_totals()), INVOICE_TOTALS_KEYS)
     
     context = {
         'invoices': invoices,
-        'total_invoices': total_invoices,
-        'unpaid_invoices_count': unpaid_invoices.count(),
-        'total_due': total_due,
-        'invoice_forms': invoice_forms,
+        'proof_form': proof_form,
+        'proof_invoice': proof_invoice,
+        **totals,
+        **fragment_context(request.user.pk),
     }
     return render(request, 'invoices/invoices_list.html', context)
 
+@login_required
+@require_POST
+def start_proof_upload(request, invoice_id):
+    """Announce a resumable proof of payment upload; chunks follow at proof_upload"""
+    invoice = get_object_or_404(Invoice, id=invoice_id, user=request.user)
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'File size is required.'}, status=400)
+    try:
+        upload = start_upload(
+            invoice, request.POST.get('filename', ''), size,
+            request.POST.get('payment_method', ''), request.POST.get('payment_notes', ''),
+        )
+    except UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return JsonResponse(upload_state(upload), status=201)
+
+@login_required
+@require_http_methods(['GET', 'PATCH'])
+def proof_upload(request, upload_id):
+    """GET reports the offset to resume from; PATCH streams the chunk at Upload-Offset"""
+    upload = get_object_or_404(ProofUpload, pk=upload_id, invoice__user=request.user)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Upload-Offset header is required.'}, status=400)
+        try:
+            # The request body is read straight into storage, never buffered whole
+            upload = append_chunk(upload.pk, request, offset)
+        except UploadError as error:
+            upload.refresh_from_db()
+            return JsonResponse({'error': str(error), **upload_state(upload)}, status=error.status)
+        if upload.is_complete():
+            # Shown by the uploading page itself; a flashed message would land on whatever page loads next
+            return JsonResponse({
+                **upload_state(upload),
+                'message': f'Proof of payment uploaded for invoice {upload.invoice.invoice_number}! Our team will review it shortly.',
+            })
+    return JsonResponse(upload_state(upload))
+
 @staff_member_required
 def admin_invoice_list(request):
-    invoices = Invoice.objects.all().order_by('-issue_date')
+    invoices = with_proof_preview(Invoice.objects.select_related('user'))
     
     # Filtering
     status_filter = request.GET.get('status', '')
@@ -624,16 +617,23 @@ def admin_invoice_list(request):
     
     search_query = request.GET.get('search', '')
     if search_query:
-        invoices = invoices.filter(
-            models.Q(invoice_number__icontains=search_query) |
-            models.Q(user__username__icontains=search_query) |
-            models.Q(user__email__icontains=search_query) |
-            models.Q(payment_reference__icontains=search_query)
-        )
+        invoices = search_invoices(invoices, search_query)
+    
+    # Keyset pagination on (issue_date, id)
+    try:
+        page_size = min(max(int(request.GET.get('page_size', '')), 1), 200)
+    except ValueError:
+        page_size = getattr(settings, 'ADMIN_INVOICE_PAGE_SIZE', 50)
+    page, next_cursor, previous_cursor = keyset_paginate(
+        invoices,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=page_size,
+    )
     
-    # Create admin forms for each invoice
+    # Create admin forms for the invoices on this page only
     admin_forms = {}
-    for invoice in invoices:
+    for invoice in page:
         admin_forms[invoice.id] = AdminPaymentVerificationForm(instance=invoice)
     
     if request.method == 'POST' and 'verify_payment' in request.POST:
@@ -649,7 +649,9 @@ def admin_invoice_list(request):
             admin_forms[invoice.id] = admin_form
     
     context = {
-        'invoices': invoices,
+        'invoices': page,
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
         'status_filter': status_filter,
         'search_query': search_query,
         'admin_forms': admin_forms,
@@ -699,10 +701,6 @@ def payment_guide(request):
 
 def export_participants_pdf(participants, user_summary, participant_invoices_map, total_paid_all_users, request_user):
     """Export participants data to PDF"""
-    from io import BytesIO
-    from django.template.loader import render_to_string
-    from xhtml2pdf import pisa
-    
     html_string = render_to_string('invoices/participants_pdf_report.html', {
         'participants': participants,
         'user_summary': user_summary,
@@ -713,57 +711,23 @@ def export_participants_pdf(participants, user_summary, participant_invoices_map
         'generated_by': request_user,
     })
     
-    result = BytesIO()
-    pdf = pisa.pisaDocument(BytesIO(html_string.encode("UTF-8")), result)
+    try:
+        pdf = pdf_renderer.render(html_string)
+    except PdfRenderUnavailable:
+        return pdf_unavailable_response()
     
-    if not pdf.err:
-        response = HttpResponse(result.getvalue(), content_type='application/pdf')
+    if pdf is not None:
+        response = HttpResponse(pdf, content_type='application/pdf')
         response['Content-Disposition'] = 'attachment; filename="participants_report.pdf"'
         return response
     
     return HttpResponse('Error generating PDF', status=500)
 
 
-def export_participants_csv(participants, participant_invoices_map, total_paid_all_users):
-    """Export participants data to CSV"""
-    import csv
-    response = HttpResponse(content_type='text/csv')
+def export_participants_csv(participants):
+    """Stream participants data as CSV"""
+    response = StreamingHttpResponse(participants_csv_rows(participants), content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="participants_report.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow([
-        'Participant Name', 'Email', 'Phone', 'Registered By', 
-        'User Email', 'Invoice Count', 'Invoice Status', 'Total Amount',
-        'Paid Amount', 'Registration Date'  # ADDED: Paid Amount
-    ])
-    
-    for participant in participants:
-        user = participant.user
-        invoices = participant_invoices_map.get(participant.id, [])
-        invoice_count = len(invoices)
-        invoice_status = ", ".join([inv.get_status_display() for inv in invoices]) if invoices else "No Invoice"
-        total_amount = sum(inv.total_amount for inv in invoices) if invoices else 0
-        paid_amount = sum(inv.total_amount for inv in invoices if inv.status == 'paid') if invoices else 0  # NEW: Paid amount
-        
-        writer.writerow([
-            participant.name,
-            participant.email,
-            participant.phone,
-            user.username,
-            user.email,
-            invoice_count,
-            invoice_status,
-            total_amount,
-            paid_amount,  # NEW: Paid amount
-            participant.created_at.strftime('%Y-%m-%d')
-        ])
-    
-    # Add summary row
-    writer.writerow([])
-    writer.writerow(['SUMMARY', '', '', '', '', '', '', '', ''])
-    writer.writerow(['Total Participants', len(participants)])
-    writer.writerow(['Total Paid Amount (All Users)', f"KES {total_paid_all_users:,.2f}"])
-    
     return response
 
 
@@ -779,65 +743,30 @@ def admin_participants_list(request):
     
     search_query = request.GET.get('search', '')
     if search_query:
-        participants = participants.filter(
-            models.Q(name__icontains=search_query) |
-            models.Q(email__icontains=search_query) |
-            models.Q(phone__icontains=search_query) |
-            models.Q(user__username__icontains=search_query)
-        )
+        participants = search_participants(participants, search_query)
+    
+    # CSV export streams straight from the queryset
+    export_format = request.GET.get('export', '')
+    if export_format == 'csv':
+        return export_participants_csv(participants)
     
     # Calculate statistics
-    total_participants = participants.count()
-    total_users = User.objects.filter(participants__isnull=False).distinct().count()
-    
-    # Get users with their paid invoices
-    users_with_counts = User.objects.filter(
-        participants__isnull=False
-    ).annotate(
-        participant_count=models.Count('participants')
-    ).distinct()
-    
-    user_summary = {}
-    for user in users_with_counts:
-        user_invoices = Invoice.objects.filter(user=user)
-        paid_invoices = user_invoices.filter(status='paid')
-        total_paid_amount = paid_invoices.aggregate(
-            total_paid=models.Sum('total_amount')
-        )['total_paid'] or 0
-        
-        user_summary[user.id] = {
-            'user': user,
-            'participant_count': user.participant_count,
-            'total_invoices': user_invoices.count(),
-            'paid_invoices': paid_invoices.count(),
-            'total_amount': user_invoices.aggregate(
-                total=models.Sum('total_amount')
-            )['total'] or 0,
-            'total_paid_amount': total_paid_amount,  # NEW: Total paid amount
-        }
+    participants = list(with_invoice_list(participants))
+    user_summary = build_user_summary()
+    total_participants = len(participants)
+    total_users = len(user_summary)
     
-    # Get invoices for each participant
-    all_invoices = Invoice.objects.prefetch_related('participants')
+    # Map participants to their invoices for the PDF export
     participant_invoices_map = {}
-    
-    for invoice in all_invoices:
-        for participant in invoice.participants.all():
-            if participant.id not in participant_invoices_map:
-                participant_invoices_map[participant.id] = []
-            participant_invoices_map[participant.id].append(invoice)
-    
-    # Add invoices to each participant for template use
     for participant in participants:
-        participant.invoice_list = participant_invoices_map.get(participant.id, [])
+        participant_invoices_map[participant.id] = participant.invoice_list
+        participant.user_participant_count = user_summary[participant.user_id]['participant_count']
     
     # Calculate total paid amount across all users
     total_paid_all_users = sum(summary['total_paid_amount'] for summary in user_summary.values())
     
     # Export functionality
-    export_format = request.GET.get('export', '')
-    if export_format == 'csv':
-        return export_participants_csv(participants, participant_invoices_map, total_paid_all_users)
-    elif export_format == 'pdf':
+    if export_format == 'pdf':
         return export_participants_pdf(participants, user_summary, participant_invoices_map, total_paid_all_users, request.user)
     
     context = {